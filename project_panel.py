@@ -18,10 +18,25 @@
 # Copyright (C) 2022, Mark Elek, David Elek
 
 
+import argparse
 import bpy
+import collections
 import contextlib
-from bpy.props import EnumProperty, BoolProperty, FloatProperty, FloatVectorProperty
-from bpy.types import Panel
+import hashlib
+import itertools
+import json
+import math
+import numpy
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from bpy.props import EnumProperty, BoolProperty, FloatProperty, FloatVectorProperty, IntProperty, PointerProperty
+from bpy.app.handlers import persistent
+from bpy.types import Operator, Panel
 
 
 BASIC_INSTANCE_KW = "_BI"
@@ -31,6 +46,250 @@ EXTRA_PLANE_KW = "_EP"
 FRAME_KW = "_FR"
 FLOOR_KW = "_FL"
 
+# handle name -> (node group, node, input) of the node inputs the setters write to
+NODE_INPUT_HANDLES = {
+    "color_texture": ("Plane Setup Nodes", "Image Texture", "Image"),
+    "extra_color_texture": ("Plane Setup Nodes", "Image Texture.001", "Image"),
+    "height_texture": ("Instancing Nodes", "Image Texture", "Image"),
+    "base_object": ("Instancing Nodes", "Object Info", 0),
+    "extra_object": ("Instancing Nodes", "Object Info.001", 0),
+    "base_proxy_object": ("Instancing Nodes", "Object Info.002", 0),
+    "extra_proxy_object": ("Instancing Nodes", "Object Info.003", 0),
+    "base_material": ("Instancing Nodes", "Set Material", 2),
+    "extra_material": ("Instancing Nodes", "Set Material.001", 2),
+    "culling_camera": ("Instancing Nodes", "FrustumCullingGroup", 0),
+    "look_at_object": ("Instancing Nodes", "LookAtRotation", 0),
+    "extra_look_at_object": ("Instancing Nodes", "ExtraLookAtRotation", 0),
+    "extra_glass_material": ("Extra Glass Nodes", "Set Material", "Material"),
+    "extra_plane_material": ("Extra Glass Nodes", "Set Material.001", "Material"),
+    "frame_object": ("Frame Nodes", "Object Info", 0),
+}
+
+# handle name -> node of the "World" world
+WORLD_NODE_HANDLES = {
+    "background_color": "Background Color",
+    "environment_texture": "Environment Texture",
+    "hdri_lighting": "HDRI Lighting",
+}
+
+
+class SceneHandles:
+    # references to everything the panels and setters touch, resolved and
+    # validated once instead of on every redraw/frame
+
+    def __init__(self):
+        missing = []
+        # (collection, name, item) of every ID and modifier looked up, the
+        # nodes and sockets inside the groups are checked through their group
+        self.lookups = []
+
+        def lookup(collection, name, path):
+            item = collection.get(name) if collection is not None else None
+            if item is None:
+                missing.append(path)
+            elif isinstance(item, (bpy.types.ID, bpy.types.Modifier)):
+                self.lookups.append((collection, name, item))
+            return item
+
+        self.plane = lookup(bpy.data.objects, "Plane", "Plane")
+        self.floor = lookup(bpy.data.objects, "Floor", "Floor")
+        modifiers = self.plane.modifiers if self.plane else None
+        self.settings = lookup(modifiers, "Settings", "Plane/Settings")
+        self.plane_setup = lookup(modifiers, "Plane Setup", "Plane/Plane Setup")
+        self.boolean = lookup(modifiers, "Boolean", "Plane/Boolean")
+        if self.settings:
+            for socket in sorted({setting.socket for setting in SETTINGS if setting.socket}):
+                if socket not in self.settings:
+                    missing.append("Plane/Settings/" + socket)
+
+        self.inputs = {}
+        for handle, (group_name, node_name, socket) in NODE_INPUT_HANDLES.items():
+            group = lookup(bpy.data.node_groups, group_name, group_name)
+            node = lookup(group.nodes if group else None, node_name,
+                          group_name + "/" + node_name)
+            if node is None:
+                continue
+            try:
+                self.inputs[handle] = node.inputs[socket]
+            except (IndexError, KeyError):
+                missing.append("{}/{}/{}".format(group_name, node_name, socket))
+
+        self.world_nodes = {}
+        self.world = world = lookup(bpy.data.worlds, "World", "World")
+        for handle, node_name in WORLD_NODE_HANDLES.items():
+            node = lookup(world.node_tree.nodes if world else None, node_name,
+                          "World/" + node_name)
+            if node is not None:
+                self.world_nodes[handle] = node
+
+        if missing:
+            raise RuntimeError("3D Pixels scene is missing: " + ", ".join(missing))
+
+    def is_valid(self):
+        # anything deleted, renamed or replaced since the lookup; node edits
+        # inside the groups drop the handles in watch_animation()
+        try:
+            return all(collection.get(name) == item for collection, name, item in self.lookups)
+        except ReferenceError:
+            return False
+
+
+_handles = None
+
+
+def scene_handles():
+    global _handles
+    if _handles is None or not _handles.is_valid():
+        _handles = SceneHandles()
+    return _handles
+
+
+@persistent
+def invalidate_scene_handles(*args):
+    global _handles
+    _handles = None
+
+
+def is_pixels_file():
+    # load handlers stay installed for every file opened in the session, only
+    # the ones with the 3D Pixels plane are theirs to touch
+    plane = bpy.data.objects.get("Plane")
+    return plane is not None and plane.modifiers.get("Settings") is not None
+
+
+@persistent
+def resolve_scene_handles(*args):
+    invalidate_scene_handles()
+    if is_pixels_file():
+        scene_handles()
+
+
+def panel_handles(layout):
+    try:
+        return scene_handles()
+    except RuntimeError as error:
+        layout.label(text=str(error), icon='ERROR')
+        return None
+
+
+# ID blocks waiting for an update tag while tags are being coalesced
+_tag_queue = None
+
+
+def tag_update(id_data):
+    if _tag_queue is None:
+        id_data.update_tag()
+    else:
+        _tag_queue.setdefault(id_data.as_pointer(), id_data)
+
+
+@contextlib.contextmanager
+def coalesced_update_tags():
+    # collect the update tags of every setter run inside the block and issue
+    # each of them once at the end
+    global _tag_queue
+    if _tag_queue is not None:
+        # nested block, the outer one issues the tags
+        yield
+        return
+    _tag_queue = {}
+    try:
+        yield
+    finally:
+        queue, _tag_queue = _tag_queue, None
+        for id_data in queue.values():
+            id_data.update_tag()
+
+
+# float settings round-trip through single precision on the scene properties
+FLOAT_TOLERANCE = 1e-6
+
+
+def values_differ(current, value):
+    if current is None:
+        return True
+    if isinstance(value, str) or isinstance(current, str):
+        return current != value
+    if isinstance(value, (bool, int, float)):
+        if isinstance(value, float) or isinstance(current, float):
+            return not math.isclose(current, value, rel_tol=FLOAT_TOLERANCE, abs_tol=FLOAT_TOLERANCE)
+        return current != value
+    current, value = tuple(current), tuple(value)
+    return len(current) != len(value) or any(
+        values_differ(a, b) for a, b in zip(current, value))
+
+
+def write_input(settings, socket, value):
+    # returns False (and writes nothing) when the input already holds value
+    if not values_differ(settings.get(socket), value):
+        return False
+    settings[socket] = value
+    return True
+
+
+# "Settings" modifier writes waiting for the slider interaction to settle,
+# socket -> value
+_pending_inputs = {}
+_last_queued = 0.0
+_release_watcher_running = False
+
+
+def queue_input(plane, socket, value):
+    global _last_queued
+    scene = bpy.context.scene
+    settings = scene_handles().settings
+    if not values_differ(settings.get(socket), value):
+        _pending_inputs.pop(socket, None)
+        return
+    if bpy.app.background or scene.input_debounce <= 0.0:
+        settings[socket] = value
+        tag_update(plane)
+        return
+
+    _pending_inputs[socket] = value
+    _last_queued = time.monotonic()
+    if not bpy.app.timers.is_registered(debounce_timer):
+        bpy.app.timers.register(debounce_timer, first_interval=scene.input_debounce)
+    if scene.flush_on_release and not _release_watcher_running and bpy.context.window:
+        with contextlib.suppress(RuntimeError):
+            bpy.ops.pixels.flush_on_release('INVOKE_DEFAULT')
+
+
+def flush_pending_inputs():
+    global _pending_inputs
+    if not _pending_inputs:
+        return
+    pending, _pending_inputs = _pending_inputs, {}
+    handles = scene_handles()
+    changed = [socket for socket, value in pending.items()
+               if write_input(handles.settings, socket, value)]
+    if changed:
+        tag_update(handles.plane)
+
+
+def debounce_timer():
+    remaining = _last_queued + bpy.context.scene.input_debounce - time.monotonic()
+    if _pending_inputs and remaining > 0.0:
+        return remaining
+    flush_pending_inputs()
+    return None
+
+
+@persistent
+def flush_before_render(scene, depsgraph=None):
+    flush_pending_inputs()
+
+
+@persistent
+def discard_pending_inputs(*args):
+    # writes queued against the file being closed must not land on the next
+    # one, and its window (with the release watcher's modal) goes away
+    global _release_watcher_running
+    _pending_inputs.clear()
+    _release_watcher_running = False
+    if bpy.app.timers.is_registered(debounce_timer):
+        bpy.app.timers.unregister(debounce_timer)
+
 
 class BASE_PANEL:
     bl_space_type = "VIEW_3D"
@@ -51,8 +310,8 @@ class VIEW3D_PT_viewport_optimization_settings(BASE_PANEL, Panel):
             layout.label(text="", icon='MODIFIER_OFF')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             # Frustum Culling settings box
             layout = self.layout
             scene = context.scene
@@ -66,7 +325,20 @@ class VIEW3D_PT_viewport_optimization_settings(BASE_PANEL, Panel):
             row = box.row()
             row.prop_search(scene, "culling_camera",
                             bpy.data, "cameras", text="")
-            row.enabled = scene.use_frustum_culling
+            row.enabled = scene.use_frustum_culling or scene.use_cached_culling or scene.use_lod
+            row = box.row()
+            row.prop(scene, 'use_cached_culling',
+                     text="Cache Culling per Camera Pose", toggle=True)
+            row = box.row()
+            row.prop(scene, 'culling_margin', text="Culling Margin", slider=True)
+            row.enabled = scene.use_frustum_culling and scene.use_cached_culling
+            row = box.row()
+            row.prop(scene, 'use_occlusion_culling',
+                     text="Occlusion Culling", toggle=True)
+            row.enabled = scene.use_cached_culling
+            row = box.row()
+            row.prop(scene, 'occlusion_margin', text="Occlusion Margin")
+            row.enabled = scene.use_cached_culling and scene.use_occlusion_culling
 
             box = layout.box()
             row = box.row()
@@ -82,6 +354,34 @@ class VIEW3D_PT_viewport_optimization_settings(BASE_PANEL, Panel):
             row.prop(scene, 'use_extra_proxy_object',
                      text="Use Extra Proxy Object", toggle=True)
             row = box.row()
+            row.prop(scene, 'use_lod', text="Distance LOD", toggle=True)
+            col = box.column(align=True)
+            col.prop(scene, 'lod_proxy_size', text="Proxy Below")
+            col.prop(scene, 'lod_quad_size', text="Quad Below")
+            col.prop(scene, 'lod_hysteresis', text="Hysteresis", slider=True)
+            col.enabled = scene.use_lod
+            row = box.row()
+
+            box = layout.box()
+            row = box.row()
+            row.label(text="Instance Estimate:")
+            for label, realized, detail_size in (
+                    ("Viewport", viewport_realized(scene), scene.detail_size),
+                    ("Render", render_realized(scene), scene.render_detail_size)):
+                base, extra, triangles, memory = instance_estimate(scene, handles, realized,
+                                                                   detail_size)
+                col = box.column(align=True)
+                col.label(text="{}: {:,} base, {:,} extra".format(label, base, extra))
+                col.label(text="~{:,} triangles, ~{:,.0f} MB".format(triangles, memory / 1024 ** 2))
+            row = box.row()
+            row.prop(scene, 'fit_budget_mode', expand=True)
+            budgets = (('viewport_memory_budget', 'render_memory_budget')
+                       if scene.fit_budget_mode == 'MEMORY'
+                       else ('viewport_instance_budget', 'render_instance_budget'))
+            for budget, target in zip(budgets, ('VIEWPORT', 'RENDER')):
+                row = box.row(align=True)
+                row.prop(scene, budget, text=target.title())
+                row.operator("pixels.fit_detail_size", text="Fit").target = target
 
             box = layout.box()
             row = box.row()
@@ -99,6 +399,24 @@ class VIEW3D_PT_viewport_optimization_settings(BASE_PANEL, Panel):
             row = box.row()
             row.prop(scene.cycles, 'use_fast_gi',
                      text="Fast Global Illumination", toggle=True)
+            row = box.row()
+            row.prop(scene, 'input_debounce', text="Slider Debounce")
+            row = box.row()
+            row.prop(scene, 'flush_on_release',
+                     text="Apply on Mouse Release", toggle=True)
+            row = box.row()
+            row.prop(scene, 'use_grid_textures',
+                     text="Grid Sized Textures", toggle=True)
+            row = box.row()
+            row.prop(scene, 'use_native_drivers',
+                     text="Native Animation Drivers", toggle=True)
+            row = box.row()
+            handler_count = active_handler_count()
+            if handler_count > len(HANDLERS) + len(frame_handlers(scene)):
+                row.label(text="Handlers: {} (run the script only once)".format(handler_count),
+                          icon='ERROR')
+            else:
+                row.label(text="Handlers: {}".format(handler_count), icon='INFO')
 
 
 class VIEW3D_PT_quick_settings(BASE_PANEL, Panel):
@@ -111,11 +429,13 @@ class VIEW3D_PT_quick_settings(BASE_PANEL, Panel):
 
     def draw(self, context):
         scene = context.scene
-        gm_color_img_texture = bpy.data.node_groups["Plane Setup Nodes"].nodes["Image Texture"]
-        gm_height_img_texture = bpy.data.node_groups["Instancing Nodes"].nodes["Image Texture"]
-        gm_inst_object_info_node = bpy.data.node_groups["Instancing Nodes"].nodes["Object Info"]
-
         layout = self.layout
+        handles = panel_handles(layout)
+        if handles is None:
+            return
+        gm_color_img_input = handles.inputs["color_texture"]
+        gm_height_img_input = handles.inputs["height_texture"]
+
         box = layout.box()
         row = box.row()
         row.prop(scene, 'detail_size', text="Base Scale XY", slider=True)
@@ -131,16 +451,16 @@ class VIEW3D_PT_quick_settings(BASE_PANEL, Panel):
         row = box.row()
         row.label(text="Height Texture:")
         row = box.row()
-        row.template_ID(gm_height_img_texture.inputs['Image'],
+        row.template_ID(gm_height_img_input,
                         "default_value", new="image.new", open="image.open")
         row = box.row()
         row.label(text="Color Texture:")
         row = box.row()
         if scene.shading_mode == 'VERTEX':
-            if gm_color_img_texture is None or "Invisible" in scene.base_material.name:
+            if "Invisible" in scene.base_material.name:
                 row.label(text="No Texture in Material:", icon='ERROR')
             else:
-                row.template_ID(gm_color_img_texture.inputs['Image'],
+                row.template_ID(gm_color_img_input,
                                 "default_value", new="image.new", open="image.open")
         else:
             try:
@@ -178,8 +498,8 @@ class VIEW3D_PT_grid_settings(BASE_PANEL, Panel):
         layout.label(text="", icon='LIGHTPROBE_GRID')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             layout = self.layout
             scene = context.scene
             box = layout.box()
@@ -200,8 +520,8 @@ class VIEW3D_PT_instance_objects(BASE_PANEL, Panel):
         layout.label(text="", icon='OBJECT_DATA')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             layout = self.layout
             scene = context.scene
 
@@ -229,6 +549,18 @@ class VIEW3D_PT_instance_objects(BASE_PANEL, Panel):
             row.label(text="Height threshold Mode:")
             row = box.row()
             row.prop(scene, 'threshold_mode', text="")
+            histogram = height_histogram(scene, handles)
+            if histogram is not None:
+                row = box.row()
+                row.label(text=histogram_text(histogram[1], scene.extra_object_threshold))
+                # the same counts as the estimate in Viewport Optimization
+                base, extra = pin_counts(scene, handles, True, scene.render_detail_size)
+                row = box.row()
+                row.label(text="Extra Instances: {:,} of {:,}".format(extra, base))
+                row.enabled = scene.use_extra_object
+                if not render_realized(scene):
+                    row = box.row()
+                    row.label(text="Extra objects need Use Instances Only off", icon='INFO')
 
 
 class VIEW3D_PT_base_scale(BASE_PANEL, Panel):
@@ -240,9 +572,9 @@ class VIEW3D_PT_base_scale(BASE_PANEL, Panel):
         layout.label(text="", icon='ORIENTATION_VIEW')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
-            gm_height_img_texture = bpy.data.node_groups["Instancing Nodes"].nodes["Image Texture"]
+        handles = panel_handles(self.layout)
+        if handles:
+            gm_height_img_input = handles.inputs["height_texture"]
             layout = self.layout
             scene = context.scene
 
@@ -271,12 +603,16 @@ class VIEW3D_PT_base_scale(BASE_PANEL, Panel):
             row = box.row()
             row.label(text="Height Texture:")
             row = box.row()
-            row.template_ID(gm_height_img_texture.inputs['Image'],
+            row.template_ID(gm_height_img_input,
                             "default_value", new="image.new", open="image.open")
             row.enabled = not scene.keep_base_height
             row = box.row()
             row.prop(scene, 'keep_base_height',
                      toggle=True, text="Keep Base Height")
+            row = box.row()
+            row.prop(scene, 'use_baked_height',
+                     toggle=True, text="Bake Height Field")
+            row.enabled = not scene.keep_base_height
 
 
 class VIEW3D_PT_base_rotation(BASE_PANEL, Panel):
@@ -288,8 +624,8 @@ class VIEW3D_PT_base_rotation(BASE_PANEL, Panel):
         layout.label(text="", icon='ORIENTATION_GIMBAL')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             layout = self.layout
             scene = context.scene
 
@@ -322,9 +658,9 @@ class VIEW3D_PT_base_shading(BASE_PANEL, Panel):
         layout.label(text="", icon='SHADING_RENDERED')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
-            gm_color_img_texture = bpy.data.node_groups["Plane Setup Nodes"].nodes["Image Texture"]
+        handles = panel_handles(self.layout)
+        if handles:
+            gm_color_img_input = handles.inputs["color_texture"]
 
             scene = context.scene
             layout = self.layout
@@ -341,16 +677,15 @@ class VIEW3D_PT_base_shading(BASE_PANEL, Panel):
             row.enabled = not scene.use_instances_only
             row = box.row()
             row.prop(scene, 'bevel_size', text="Bevel Size:", slider=True)
-            plane_settings = bpy.data.objects["Plane"].modifiers["Plane Setup"]
-            if plane_settings:
+            if handles.plane_setup:
                 row = box.row()
                 row.label(text="Color Texture:")
                 row = box.row()
                 if scene.shading_mode == 'VERTEX':
-                    if gm_color_img_texture is None or "Invisible" in scene.base_material.name:
+                    if "Invisible" in scene.base_material.name:
                         row.label(text="No Texture in Material:", icon='ERROR')
                     else:
-                        row.template_ID(gm_color_img_texture.inputs['Image'],
+                        row.template_ID(gm_color_img_input,
                                         "default_value", new="image.new", open="image.open")
                 else:
                     try:
@@ -388,8 +723,8 @@ class VIEW3D_PT_environment(BASE_PANEL, Panel):
         layout.label(text="", icon='WORLD')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             scene = context.scene
             layout = self.layout
             box = layout.box()
@@ -405,14 +740,14 @@ class VIEW3D_PT_environment(BASE_PANEL, Panel):
             elif scene.background_mode == 'TEXTURE':
                 row.label(text="Environment Texture:")
                 row = box.row()
-                environment_texture_node = bpy.data.worlds["World"].node_tree.nodes["Environment Texture"]
+                environment_texture_node = handles.world_nodes["environment_texture"]
                 row.template_ID(environment_texture_node, 'image',
                                 new="image.new", open="image.open")
 
             row = box.row()
             row.label(text="HDRI Lighting:")
             row = box.row()
-            hdri_texture_node = bpy.data.worlds["World"].node_tree.nodes["HDRI Lighting"]
+            hdri_texture_node = handles.world_nodes["hdri_lighting"]
             row.template_ID(hdri_texture_node, 'image',
                             new="image.new", open="image.open")
 
@@ -426,8 +761,8 @@ class VIEW3D_PT_extra_scale(BASE_PANEL, Panel):
         layout.label(text="", icon='ADD')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             layout = self.layout
             scene = context.scene
 
@@ -466,8 +801,8 @@ class VIEW3D_PT_extra_rotation(BASE_PANEL, Panel):
         layout.label(text="", icon='ADD')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             layout = self.layout
             scene = context.scene
 
@@ -500,8 +835,8 @@ class VIEW3D_PT_extra_location(BASE_PANEL, Panel):
         layout.label(text="", icon='ADD')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             layout = self.layout
             scene = context.scene
 
@@ -520,9 +855,9 @@ class VIEW3D_PT_extra_shading(BASE_PANEL, Panel):
         layout.label(text="", icon='ADD')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
         layout = self.layout
         scene = context.scene
+        handles = panel_handles(layout)
 
         box = layout.box()
         row = box.row()
@@ -532,15 +867,14 @@ class VIEW3D_PT_extra_shading(BASE_PANEL, Panel):
         row = box.row()
         row.prop(scene, 'extra_bevel_size',
                  text="Extra Bevel Size:", slider=True)
-        if settings:
-            gm_extra_color_img_texture = bpy.data.node_groups[
-                "Plane Setup Nodes"].nodes["Image Texture.001"]
+        if handles:
+            gm_extra_color_img_input = handles.inputs["extra_color_texture"]
 
             row = box.row()
             row.label(text="Extra Color Texture:")
             row = box.row()
             if scene.extra_shading_mode == 'VERTEX':
-                row.template_ID(gm_extra_color_img_texture.inputs['Image'],
+                row.template_ID(gm_extra_color_img_input,
                                 "default_value", new="image.new", open="image.open")
             else:
                 try:
@@ -578,14 +912,13 @@ class VIEW3D_PT_extra_glass(BASE_PANEL, Panel):
         layout.label(text="", icon='ADD')
 
     def draw(self, context):
-        extra_glass_gm_mat_node = bpy.data.node_groups["Extra Glass Nodes"].nodes["Set Material"]
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
         layout = self.layout
         scene = context.scene
+        handles = panel_handles(layout)
 
         box = layout.box()
         row = box.row()
-        if settings and extra_glass_gm_mat_node:
+        if handles:
             row.label(text="Extra Glass Settings:")
             row = box.row()
             row.prop(scene, 'extra_glass_material', text="")
@@ -619,8 +952,8 @@ class VIEW3D_PT_extra_plane(BASE_PANEL, Panel):
         layout.label(text="", icon='ADD')
 
     def draw(self, context):
-        settings = bpy.data.objects["Plane"].modifiers["Settings"]
-        if settings:
+        handles = panel_handles(self.layout)
+        if handles:
             layout = self.layout
             scene = context.scene
             box = layout.box()
@@ -654,9 +987,12 @@ class VIEW3D_PT_boolean_settings(BASE_PANEL, Panel):
 
     def draw(self, context):
         scene = context.scene
-        boolean_modifier = bpy.data.objects["Plane"].modifiers["Boolean"]
-
         layout = self.layout
+        handles = panel_handles(layout)
+        if handles is None:
+            return
+        boolean_modifier = handles.boolean
+
         box = layout.box()
         row = box.row()
         row.label(text="Boolean Object:")
@@ -757,38 +1093,66 @@ class VIEW3D_PT_about(BASE_PANEL, Panel):
             "wm.url_open", text="Documentation (URL)").url = "https://3d-pixels.readthedocs.io/en/latest/"
 
 
-def sampling_mode_enum_set(self, context):
-    scene = bpy.context.scene
-    sampling_mode = scene.sampling_mode
-    plane = bpy.data.objects["Plane"]
-    settings = plane.modifiers["Settings"]
-
-    if sampling_mode == 'ALL':
-        settings["Input_8"] = 0
-    elif sampling_mode == 'RED':
-        settings["Input_8"] = 1
-    elif sampling_mode == 'GREEN':
-        settings["Input_8"] = 2
-    else:
-        settings["Input_8"] = 3
+class PIXELS_OT_flush_on_release(Operator):
+    bl_idname = "pixels.flush_on_release"
+    bl_label = "Flush Settings on Release"
+    bl_options = {'INTERNAL'}
+
+    def invoke(self, context, event):
+        global _release_watcher_running
+        _release_watcher_running = True
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        global _release_watcher_running
+        if not _pending_inputs:
+            _release_watcher_running = False
+            return {'FINISHED', 'PASS_THROUGH'}
+        if event.type == 'LEFTMOUSE' and event.value == 'RELEASE':
+            flush_pending_inputs()
+            _release_watcher_running = False
+            return {'FINISHED', 'PASS_THROUGH'}
+        return {'PASS_THROUGH'}
+
+
+FIT_TARGET_ITEMS = (('VIEWPORT', 'Viewport', ''),
+                    ('RENDER', 'Render', ''),
+                    )
+
 
-    plane.update_tag()
+class PIXELS_OT_fit_detail_size(Operator):
+    bl_idname = "pixels.fit_detail_size"
+    bl_label = "Fit Detail Size to Budget"
+    bl_description = "Set the finest detail size whose estimated instances fit the budget"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    target: EnumProperty(items=FIT_TARGET_ITEMS)
+
+    def execute(self, context):
+        scene = context.scene
+        detail_size, fitted = fit_detail_size(scene, scene_handles(), self.target)
+        setattr(scene, FIT_TARGETS[self.target][0], detail_size)
+        if not fitted:
+            self.report({'WARNING'}, "Even the largest detail size exceeds the budget")
+        return {'FINISHED'}
 
 
 def shading_mode_enum_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
+    handles = scene_handles()
+    plane = handles.plane
+    plane_settings = handles.settings
     shading_mode = scene.shading_mode
-    gm_color_img_texture = bpy.data.node_groups["Plane Setup Nodes"].nodes["Image Texture"]
+    gm_color_img_input = handles.inputs["color_texture"]
 
     if shading_mode == 'VERTEX':
         plane_settings["Input_31"] = 0
         mat = scene.base_material
         texture_node = mat.node_tree.nodes["Image Texture"]
-        gm_color_img_texture.inputs['Image'].default_value = texture_node.image
+        gm_color_img_input.default_value = texture_node.image
 
-        plane.update_tag()
+        tag_update(plane)
 
     elif shading_mode == 'TEXTURED':
         plane_settings["Input_31"] = 1
@@ -800,27 +1164,28 @@ def shading_mode_enum_set(self, context):
                 and not contains_keyword(EXTRA_INSTANCE_KW, mat.name)]
             for mat in materials:
                 texture_node = mat.node_tree.nodes["Image Texture"]
-                texture_node.image = gm_color_img_texture.inputs['Image'].default_value
+                texture_node.image = gm_color_img_input.default_value
 
-            plane.update_tag()
+            tag_update(plane)
 
 
 def extra_shading_mode_enum_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
+    handles = scene_handles()
+    plane = handles.plane
+    plane_settings = handles.settings
     shading_mode = scene.extra_shading_mode
 
-    gm_color_img_texture = bpy.data.node_groups["Plane Setup Nodes"].nodes["Image Texture.001"]
+    gm_color_img_input = handles.inputs["extra_color_texture"]
 
     if shading_mode == 'VERTEX':
         plane_settings["Input_32"] = 0
         mat = scene.extra_material
         texture_node = mat.node_tree.nodes["Image Texture"]
-        gm_color_img_texture.inputs['Image'].default_value = texture_node.image
+        gm_color_img_input.default_value = texture_node.image
 
         if scene.use_extra_object:
-            plane.update_tag()
+            tag_update(plane)
 
     elif shading_mode == 'TEXTURED':
         plane_settings["Input_32"] = 1
@@ -832,31 +1197,23 @@ def extra_shading_mode_enum_set(self, context):
                 and not contains_keyword(BASIC_INSTANCE_KW, mat.name)]
             for mat in materials:
                 texture_node = mat.node_tree.nodes["Image Texture"]
-                texture_node.image = gm_color_img_texture.inputs['Image'].default_value
+                texture_node.image = gm_color_img_input.default_value
 
             if scene.use_extra_object:
-                plane.update_tag()
-
-
-def use_extra_glass_bool_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_4"] = 1 if scene.use_extra_glass else 0
-    plane.update_tag()
+                tag_update(plane)
 
 
 def extra_glass_material_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    extra_glass_gm_mat_node = bpy.data.node_groups["Extra Glass Nodes"].nodes["Set Material"]
-    extra_glass_gm_mat_node.inputs['Material'].default_value = scene.extra_glass_material
+    handles = scene_handles()
+    plane = handles.plane
+    handles.inputs["extra_glass_material"].default_value = scene.extra_glass_material
 
     mat = scene.extra_glass_material
     glass_material_node = mat.node_tree.nodes.get("RGB")
     scene.extra_glass_color = glass_material_node.outputs[0].default_value
 
-    plane.update_tag()
+    tag_update(plane)
 
 
 def extra_glass_material_poll(self, material):
@@ -865,301 +1222,83 @@ def extra_glass_material_poll(self, material):
 
 def extra_plane_material_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    extra_plane_gm_mat_node = extra_plane_gm_mat_node = bpy.data.node_groups[
-        "Extra Glass Nodes"].nodes["Set Material.001"]
-    extra_plane_gm_mat_node.inputs['Material'].default_value = scene.extra_plane_material
+    handles = scene_handles()
+    plane = handles.plane
+    handles.inputs["extra_plane_material"].default_value = scene.extra_plane_material
 
     mat = scene.extra_plane_material
     extra_plane_material_node = mat.node_tree.nodes.get("RGB")
     scene.extra_plane_color = extra_plane_material_node.outputs[0].default_value
 
-    plane.update_tag()
+    tag_update(plane)
 
 
 def extra_plane_material_poll(self, material):
     return contains_keyword(EXTRA_PLANE_KW, material.name)
 
 
-def use_extra_plane_bool_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_30"] = 1 if scene.use_extra_plane else 0
-    plane.update_tag()
-
-
-def pixelation_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_33"] = scene.pixelation
-    plane.update_tag()
-
-
-def extra_pixelation_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_34"] = scene.extra_pixelation
-    if scene.use_extra_object:
-        plane.update_tag()
-
-
-def detail_size_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_2"] = scene.detail_size
-    plane.update_tag()
     # plane.modifiers["Settings"].update_tag()
 
 
-def render_detail_size_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_40"] = scene.render_detail_size
-    plane.update_tag()
-
-
-def detail_height_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_3"] = scene.detail_height
-    plane.update_tag()
-
-
-def detail_height_multiplier_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_62"] = scene.detail_height_multiplier
-    plane.update_tag()
-
-
-def extra_glass_width_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_5"] = scene.extra_glass_width
-    if scene.use_extra_glass:
-        plane.update_tag()
-
-
-def use_pixelation_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_16"] = 1 if scene.use_pixelation else 0
-    plane.update_tag()
-
-
-def use_extra_pixelation_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_25"] = 1 if scene.use_extra_pixelation else 0
-    if scene.use_extra_object:
-        plane.update_tag()
-
-
-def extra_object_threshold_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_17"] = scene.extra_object_threshold
-    if scene.use_extra_object:
-        plane.update_tag()
-
-
-def use_extra_object_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_18"] = 1 if scene.use_extra_object else 0
-    plane.update_tag()
-
-
-def gap_size_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_21"] = scene.gap_size
-    plane.update_tag()
-
-
-def negative_size_x_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_19"] = scene.negative_size_x
-    plane.update_tag()
-
-
-def negative_size_y_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_20"] = scene.negative_size_y
-    plane.update_tag()
-
-
-def keep_extra_scale_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_22"] = 1 if scene.keep_extra_scale else 0
-    if scene.use_extra_object:
-        plane.update_tag()
-
-
-def offset_z_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_23"] = scene.offset_z
-    if scene.use_extra_object:
-        plane.update_tag()
-
-
-def use_frustum_culling_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_26"] = 1 if scene.use_frustum_culling else 0
-    plane.update_tag()
-
-
 def culling_camera_set(self, context):
     scene = bpy.context.scene
     if scene.culling_camera is not None:
-        gm_frustum_culling_node_group = bpy.data.node_groups[
-            "Instancing Nodes"].nodes["FrustumCullingGroup"]
-        plane = bpy.data.objects["Plane"]
+        handles = scene_handles()
         camera_object = bpy.data.objects[scene.culling_camera.name]
-        gm_frustum_culling_node_group.inputs[0].default_value = camera_object
-        plane.update_tag()
+        handles.inputs["culling_camera"].default_value = camera_object
+        tag_update(handles.plane)
+        refresh_culling_mask(scene)
+        refresh_lod_levels(scene)
 
 
 def use_instances_only_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_27"] = 1 if scene.use_instances_only else 0
+    handles = scene_handles()
+    plane = handles.plane
+    changed = write_input(handles.settings, "Input_27", 1 if scene.use_instances_only else 0)
     if scene.use_instances_only:
         # prevent the issue of texture change when turning on instance only mode
-        gm_color_img_texture = bpy.data.node_groups["Plane Setup Nodes"].nodes["Image Texture"]
         mat = scene.base_material
         texture_node = mat.node_tree.nodes["Image Texture"]
-        gm_color_img_texture.inputs['Image'].default_value = texture_node.image
+        handles.inputs["color_texture"].default_value = texture_node.image
 
         scene.shading_mode = "TEXTURED"
-    plane.update_tag()
-
-
-def sparse_grid_x_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_28"] = scene.sparse_grid_x
-    plane.update_tag()
-
-
-def sparse_grid_y_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_29"] = scene.sparse_grid_y
-    plane.update_tag()
+    if changed:
+        tag_update(plane)
 
 
 def boolean_operation_enum_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane.modifiers["Boolean"].operation = scene.boolean_operation
-    plane.update_tag()
+    handles = scene_handles()
+    handles.boolean.operation = scene.boolean_operation
+    tag_update(handles.plane)
 
 
 def use_boolean_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    boolean_modifier = plane.modifiers["Boolean"]
+    handles = scene_handles()
+    plane = handles.plane
+    boolean_modifier = handles.boolean
     boolean_modifier.show_viewport = scene.use_boolean
     boolean_modifier.show_render = scene.use_boolean
-    plane.update_tag()
-
-
-def base_material_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    gm_set_base_material_node = bpy.data.node_groups["Instancing Nodes"].nodes["Set Material"]
-    gm_set_base_material_node.inputs[2].default_value = scene.base_material
-    plane.update_tag()
+    tag_update(plane)
 
 
 def base_material_poll(self, material):
     return contains_keyword(BASIC_INSTANCE_KW, material.name) and not contains_keyword(EXTRA_INSTANCE_KW, material.name)
 
 
-def extra_material_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    gm_set_extra_material_node = bpy.data.node_groups["Instancing Nodes"].nodes["Set Material.001"]
-    gm_set_extra_material_node.inputs[2].default_value = scene.extra_material
-    plane.update_tag()
-
-
 def extra_material_poll(self, material):
     return contains_keyword(EXTRA_INSTANCE_KW, material.name) and not contains_keyword(BASIC_INSTANCE_KW, material.name)
 
 
-def bevel_size_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_36"] = scene.bevel_size
-    plane.update_tag()
-
-
-def extra_bevel_size_float_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_37"] = scene.extra_bevel_size
-    plane.update_tag()
-
-
-def realize_on_render_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_38"] = 1 if scene.realize_on_render else 0
-    plane.update_tag()
-
-
-def active_frame_object_set(self, context):
-    scene = bpy.context.scene
-    frame_ob_gm_node = bpy.data.node_groups["Frame Nodes"].nodes["Object Info"].inputs[0]
-    frame_ob_gm_node.default_value = scene.active_frame_object
-
-
 def active_frame_object_poll(self, object):
     return contains_keyword(FRAME_KW, object.name)
 
 
-def frame_scale_offset_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_39"] = scene.frame_scale_offset
-    plane.update_tag()
-
-
 def frame_material_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
+    plane = scene_handles().plane
     frame_ob = scene.active_frame_object
     frame_ob.active_material = scene.frame_material
 
@@ -1167,7 +1306,7 @@ def frame_material_set(self, context):
     frame_material_node = mat.node_tree.nodes.get("RGB")
     scene.frame_color = frame_material_node.outputs[0].default_value
 
-    plane.update_tag()
+    tag_update(plane)
 
 
 def frame_material_poll(self, material):
@@ -1176,116 +1315,32 @@ def frame_material_poll(self, material):
 
 def floor_material_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    floor_ob = bpy.data.objects["Floor"]
+    floor_ob = scene_handles().floor
     floor_ob.active_material = scene.floor_material
 
     mat = scene.floor_material
     floor_material_node = mat.node_tree.nodes.get("RGB")
     scene.floor_color = floor_material_node.outputs[0].default_value
 
-    plane.update_tag()
+    # the floor isn't part of the pin geometry
+    tag_update(floor_ob)
 
 
 def floor_material_poll(self, material):
     return contains_keyword(FLOOR_KW, material.name)
 
 
-def use_random_rotation_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_41"] = 1 if scene.use_random_rotation else 0
-    plane.update_tag()
-
-
-def snap_rotation_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_42"] = 1 if scene.snap_rotation else 0
-    plane.update_tag()
-
-
-def use_extra_random_rotation_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_43"] = 1 if scene.use_extra_random_rotation else 0
-    plane.update_tag()
-
-
-def extra_snap_rotation_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_44"] = 1 if scene.extra_snap_rotation else 0
-    plane.update_tag()
-
-
-def extra_scale_offset_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_45"] = scene.extra_scale_offset
-    plane.update_tag()
-
-
-def use_extra_random_scale_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_46"] = scene.use_extra_random_scale
-    plane.update_tag()
-
-
-def extra_random_scale_min_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_47"] = scene.extra_random_scale_min
-    plane.update_tag()
-
-
-def extra_random_scale_max_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_48"] = scene.extra_random_scale_max
-    plane.update_tag()
-
-
-def threshold_mode_enum_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_49"] = 1 if scene.threshold_mode == "GREATER" else 0
-    plane.update_tag()
-
-
-def active_base_object_set(self, context):
-    scene = bpy.context.scene
-    active_base_ob_gm_node = bpy.data.node_groups["Instancing Nodes"].nodes["Object Info"].inputs[0]
-    active_base_ob_gm_node.default_value = scene.active_base_object
-
-
 def active_base_object_poll(self, object):
     return contains_keyword(BASIC_INSTANCE_KW, object.name)
 
 
-def active_extra_object_set(self, context):
-    scene = bpy.context.scene
-    active_extra_ob_gm_node = bpy.data.node_groups["Instancing Nodes"].nodes["Object Info.001"].inputs[0]
-    active_extra_ob_gm_node.default_value = scene.active_extra_object
-
-
 def active_extra_object_poll(self, object):
     return contains_keyword(EXTRA_INSTANCE_KW, object.name)
 
 
 def active_boolean_object_set(self, context):
     scene = bpy.context.scene
-    boolean_modifier = bpy.data.objects["Plane"].modifiers["Boolean"]
+    boolean_modifier = scene_handles().boolean
     boolean_modifier.object = scene.active_boolean_object
 
 
@@ -1295,212 +1350,1235 @@ def active_boolean_object_poll(self, object):
 
 def extra_glass_color_set(self, context):
     scene = bpy.context.scene
-    mat = scene.extra_glass_material
-    glass_material_node = mat.node_tree.nodes.get("RGB")
-    glass_material_node.outputs[0].default_value = scene.extra_glass_color
-
-    if scene.use_extra_glass:
-        plane = bpy.data.objects["Plane"]
-        plane.update_tag()
-
-
-def base_proxy_object_set(self, context):
-    scene = bpy.context.scene
-    proxy_ob_gm_node = bpy.data.node_groups["Instancing Nodes"].nodes["Object Info.002"]
-    proxy_ob_gm_node.inputs[0].default_value = scene.base_proxy_object
-
-
-def extra_proxy_object_set(self, context):
-    scene = bpy.context.scene
-    extra_proxy_ob_gm_node = bpy.data.node_groups["Instancing Nodes"].nodes["Object Info.003"]
-    extra_proxy_ob_gm_node.inputs[0].default_value = scene.extra_proxy_object
+    write_shader_color(scene.extra_glass_material, scene.extra_glass_color)
 
 
 def proxy_object_poll(self, object):
     return "Proxy" in object.name
 
 
-def use_base_proxy_object_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_55"] = 1 if scene.use_base_proxy_object else 0
-    plane.update_tag()
-
-
-def use_extra_proxy_object_set(self, context):
-    scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_56"] = 1 if scene.use_extra_proxy_object else 0
-    plane.update_tag()
+""" def look_at_object_poll(self, object):
+    return "Look_At" in object.name """
 
 
-def use_look_at_rotation_set(self, context):
+def background_color_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_57"] = 1 if scene.use_look_at_rotation else 0
-    plane.update_tag()
+    handles = scene_handles()
+    bg_color_node = handles.world_nodes["background_color"]
+    write_shader_color(handles.world, scene.background_color, bg_color_node.inputs[0])
 
 
-def look_at_object_set(self, context):
-    scene = bpy.context.scene
-    look_at_ob_gm_node = bpy.data.node_groups["Instancing Nodes"].nodes["LookAtRotation"]
-    look_at_ob_gm_node.inputs[0].default_value = scene.extra_proxy_object
+def write_shader_color(id_data, color, socket=None):
+    # shader-only edit: re-sync the material/world, the pin geometry stays as is
+    if socket is None:
+        node = id_data.node_tree.nodes.get("RGB") if id_data is not None else None
+        if node is None:
+            return
+        socket = node.outputs[0]
+    if values_differ(socket.default_value, color):
+        socket.default_value = color
+        tag_update(id_data)
 
 
-""" def look_at_object_poll(self, object):
-    return "Look_At" in object.name """
+def contains_keyword(keyword, string):
+    return keyword.upper() in string.upper()
 
 
-def extra_location_offset_z_set(self, context):
+def extra_plane_color_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_58"] = scene.extra_location_offset_z
-    plane.update_tag()
+    write_shader_color(scene.extra_plane_material, scene.extra_plane_color)
 
 
-def use_extra_look_at_rotation_set(self, context):
+def floor_color_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_59"] = 1 if scene.use_extra_look_at_rotation else 0
-    plane.update_tag()
+    write_shader_color(scene.floor_material, scene.floor_color)
 
 
-def extra_look_at_object_set(self, context):
+def frame_color_set(self, context):
     scene = bpy.context.scene
-    look_at_ob_gm_node = bpy.data.node_groups["Instancing Nodes"].nodes["ExtraLookAtRotation"]
-    look_at_ob_gm_node.inputs[0].default_value = scene.extra_proxy_object
+    write_shader_color(scene.frame_material, scene.frame_color)
 
 
-def keep_base_height_set(self, context):
+def use_native_drivers_set(self, context):
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_60"] = 1 if scene.keep_base_height else 0
-    plane.update_tag()
+    update_frame_handler(scene)
+    if not scene.use_native_drivers:
+        # removed drivers leave their last value behind
+        apply_all(scene)
+    elif _deferred:
+        release_deferred(scene)
+
+
+# the pins the Plane Setup lays over the plane, as the Python passes (bake,
+# culling, levels of detail, estimate, histogram) model them: one pin every
+# detail_size + gap_size plane units, the lattice cells tiling the plane's
+# extent, before the sparse grid thins them out
+
+# (mesh, vertex count) -> (low, high) corners of the plane in its own space
+_plane_bounds = {}
+
+
+def plane_bounds(mesh):
+    key = (mesh.as_pointer(), len(mesh.vertices))
+    if key not in _plane_bounds:
+        coords = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+        mesh.vertices.foreach_get("co", coords)
+        coords = coords.reshape(-1, 3)
+        _plane_bounds.clear()
+        _plane_bounds[key] = coords.min(axis=0), coords.max(axis=0)
+    return _plane_bounds[key]
+
+
+def pin_grid(scene, handles, detail_size=None):
+    # (columns, rows) of the lattice at detail_size, by default the finer of
+    # the viewport and the render detail size so it holds the pins of both
+    if detail_size is None:
+        detail_size = min(scene.detail_size, scene.render_detail_size)
+    low, high = plane_bounds(handles.plane.data)
+    pitch = max(detail_size + scene.gap_size, 1e-6)
+    return (max(1, int(round((high[0] - low[0]) / pitch))),
+            max(1, int(round((high[1] - low[1]) / pitch))))
 
 
-def background_mode_set(self, context):
+# the height field baked from the height texture with numpy into a float
+# image, read by the Instancing Nodes through an Image Texture node standing
+# in for the height Image Texture
+HEIGHT_IMAGE = "pixels_height"
+BAKED_HEIGHT_NODE = "Baked Height"
+
+# what the last bake was made from, see refresh_baked_height()
+_baked_height_key = None
+
+
+# image name -> number of times the image was reloaded, painted or otherwise
+# changed, counted by watch_animation(); neither name, path nor is_dirty
+# change when a saved image is painted again or reloaded from disk
+_image_generations = collections.Counter()
+
+
+def image_key(image):
+    # changes whenever the pixels of image may have changed
+    return (image.name, image.filepath, tuple(image.size), image.is_dirty,
+            _image_generations[image.name])
+
+
+def image_array(image):
+    width, height = image.size
+    pixels = numpy.empty(width * height * image.channels, dtype=numpy.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, image.channels)
+
+
+def block_average(field, block):
+    # mean of every block x block texels (or block_y x block_x), partial
+    # blocks at the edges included, any trailing channel axis is kept
+    block_y, block_x = block if isinstance(block, tuple) else (block, block)
+    rows = numpy.arange(0, field.shape[0], block_y)
+    columns = numpy.arange(0, field.shape[1], block_x)
+    sums = numpy.add.reduceat(numpy.add.reduceat(field, rows, axis=0), columns, axis=1)
+    counts = numpy.outer(numpy.diff(numpy.append(rows, field.shape[0])),
+                         numpy.diff(numpy.append(columns, field.shape[1])))
+    return sums / counts.reshape(counts.shape + (1,) * (field.ndim - 2))
+
+
+def height_field(image, sampling_mode):
+    pixels = image_array(image)
+    if sampling_mode == 'ALL' or pixels.shape[2] < 3:
+        return pixels[..., :min(3, pixels.shape[2])].mean(axis=2)
+    return pixels[..., SAMPLING_MODE_VALUES[sampling_mode] - 1]
+
+
+# (image, sampling mode) -> the height field block averaged over 1, 2, 4, ...
+# texels, (image, None) -> the same of the color texels; the bake, the
+# culling passes, the panels and the pixelated textures share them, and an
+# animated pixelation never goes back to the full texture
+_pyramids = collections.OrderedDict()
+PYRAMID_CACHE_SIZE = 6
+
+
+def texture_pyramid(image, sampling_mode, levels):
+    key = image_key(image) + (sampling_mode,)
+    pyramid = _pyramids.get(key)
+    if pyramid is None:
+        base = image_array(image) if sampling_mode is None else height_field(image, sampling_mode)
+        pyramid = _pyramids[key] = [base]
+        while len(_pyramids) > PYRAMID_CACHE_SIZE:
+            _pyramids.popitem(last=False)
+    _pyramids.move_to_end(key)
+    while len(pyramid) < levels and min(pyramid[-1].shape[:2]) > 1:
+        pyramid.append(block_average(pyramid[-1], 2))
+    return pyramid
+
+
+def cached_height_field(image, sampling_mode):
+    return texture_pyramid(image, sampling_mode, 1)[0]
+
+
+def pixelated_field(image, sampling_mode, block):
+    # the texture pixelated into blocks of block texels, at the resolution of
+    # the pyramid level below block and blended towards the level above it
+    level = int(math.log2(max(block, 1.0)))
+    pyramid = texture_pyramid(image, sampling_mode, level + 2)
+    level = min(level, len(pyramid) - 1)
+    field = pyramid[level]
+    blend = max(block, 1.0) / 2 ** level - 1.0
+    if blend > 0.0 and level + 1 < len(pyramid):
+        rows, columns = field.shape[:2]
+        coarser = pyramid[level + 1].repeat(2, axis=0).repeat(2, axis=1)[:rows, :columns]
+        field = field + (coarser - field) * blend
+    return field
+
+
+# (toggle, amount) of the pixelation a texture follows
+PIXELATION = ("use_pixelation", "pixelation")
+EXTRA_PIXELATION = ("use_extra_pixelation", "extra_pixelation")
+
+
+def pixelation_block(scene, pixelation=PIXELATION):
+    # texels averaged into one pixelation cell, 1 when pixelation is off
+    toggle, amount = pixelation
+    return max(1.0, getattr(scene, amount)) if getattr(scene, toggle) else 1.0
+
+
+def texture_heights(scene, handles, uvs):
+    # the height texture at uvs, sampled the way its Image Texture node does,
+    # pixelated into blocks of pixelation texels
+    texture_input = handles.inputs["height_texture"]
+    block = pixelation_block(scene)
+    if block > 1.0:
+        return sample_field(pixelated_field(texture_input.default_value, scene.sampling_mode, block), uvs)
+    field = cached_height_field(texture_input.default_value, scene.sampling_mode)
+    return sample_field(field, uvs, texture_input.node.interpolation)
+
+
+def sample_field(field, uvs, interpolation='Closest'):
+    rows, columns = field.shape
+    if interpolation == 'Closest':
+        x = numpy.clip((uvs[:, 0] * columns).astype(int), 0, columns - 1)
+        y = numpy.clip((uvs[:, 1] * rows).astype(int), 0, rows - 1)
+        return field[y, x]
+    # linear (cubic and smart approximated by it) between the texel centers,
+    # edges extended
+    x = uvs[:, 0] * columns - 0.5
+    y = uvs[:, 1] * rows - 0.5
+    x0, y0 = numpy.floor(x), numpy.floor(y)
+    fx, fy = x - x0, y - y0
+    x0 = numpy.clip(x0.astype(int), 0, columns - 1)
+    y0 = numpy.clip(y0.astype(int), 0, rows - 1)
+    x1, y1 = numpy.minimum(x0 + 1, columns - 1), numpy.minimum(y0 + 1, rows - 1)
+    top = field[y0, x0] + (field[y0, x1] - field[y0, x0]) * fx
+    bottom = field[y1, x0] + (field[y1, x1] - field[y1, x0]) * fx
+    return top + (bottom - top) * fy
+
+
+def bake_height(scene, handles):
+    # the height field the pins read, channel picked and pixelated, as a float
+    # image the Baked Height node samples through the height texture's own
+    # vector, so every pin reads it where it would read the texture
+    texture_input = handles.inputs["height_texture"]
+    block = pixelation_block(scene)
+    if block > 1.0:
+        field = pixelated_field(texture_input.default_value, scene.sampling_mode, block)
+    else:
+        field = cached_height_field(texture_input.default_value, scene.sampling_mode)
+    image = field_image(HEIGHT_IMAGE, field)
+    baked_node = texture_input.node.id_data.nodes.get(BAKED_HEIGHT_NODE)
+    if baked_node is not None:
+        baked_node.inputs["Image"].default_value = image
+        baked_node.interpolation = 'Closest' if block > 1.0 else texture_input.node.interpolation
+    tag_update(handles.plane)
+
+
+def refresh_baked_height(scene):
+    # bake again only when something the height field depends on changed
+    global _baked_height_key
+    if not scene.use_baked_height:
+        return
+    handles = scene_handles()
+    image = handles.inputs["height_texture"].default_value
+    if image is None:
+        return
+    key = image_key(image) + (scene.sampling_mode, scene.use_pixelation, round(scene.pixelation, 3),
+                              handles.inputs["height_texture"].node.interpolation)
+    if key != _baked_height_key:
+        bake_height(scene, handles)
+        _baked_height_key = key
+
+
+def splice_baked_height(handles, enabled):
+    texture_node = handles.inputs["height_texture"].node
+    tree = texture_node.id_data
+    baked_node = tree.nodes.get(BAKED_HEIGHT_NODE)
+    if enabled and baked_node is None:
+        baked_node = tree.nodes.new("GeometryNodeImageTexture")
+        baked_node.name = baked_node.label = BAKED_HEIGHT_NODE
+        baked_node.interpolation = texture_node.interpolation
+        baked_node.extension = texture_node.extension
+        baked_node.inputs["Image"].default_value = bpy.data.images.get(HEIGHT_IMAGE)
+        baked_node.location = texture_node.location.x, texture_node.location.y + 300
+        for link in texture_node.inputs["Vector"].links:
+            tree.links.new(link.from_socket, baked_node.inputs["Vector"])
+        for link in list(texture_node.outputs["Color"].links):
+            tree.links.new(baked_node.outputs["Color"], link.to_socket)
+    elif not enabled and baked_node is not None:
+        for link in list(baked_node.outputs["Color"].links):
+            tree.links.new(texture_node.outputs["Color"], link.to_socket)
+        tree.nodes.remove(baked_node)
+
+
+def use_baked_height_set(self, context):
+    global _baked_height_key
     scene = bpy.context.scene
-    plane = bpy.data.objects["Plane"]
-    plane_settings = plane.modifiers["Settings"]
-    plane_settings["Input_61"] = 0 if scene.background_mode == 'COLOR' else 1
-    plane.update_tag()
-
-
-def background_color_set(self, context):
+    handles = scene_handles()
+    _baked_height_key = None
+    refresh_baked_height(scene)
+    splice_baked_height(handles, scene.use_baked_height)
+    tag_update(handles.plane)
+
+
+# values computed with numpy for every pin are stored as float images, one
+# texel per lattice cell (see pin_grid()), and read by the Instancing Nodes
+# at each pin's own position across the plane; they hold for whatever points
+# the node tree instances on, not only for the plane's vertices
+FIELD_VECTOR_NODES = ("Pin Field Position", "Pin Field Offset", "Pin Field Scale")
+# the lattice is capped to this many cells across for the field images
+FIELD_MAX_SIZE = 4096
+
+
+def field_image(name, values):
+    # float image with values (rows x columns, bottom row first) in its color
+    # channels, reused and rewritten in place
+    rows, columns = values.shape
+    image = bpy.data.images.get(name)
+    if image is None:
+        image = bpy.data.images.new(name, columns, rows, float_buffer=True, is_data=True)
+        image[GENERATED_IMAGE] = True
+    elif tuple(image.size) != (columns, rows):
+        image.scale(columns, rows)
+    pixels = numpy.ones((rows, columns, 4), dtype=numpy.float32)
+    pixels[..., :3] = values[..., None]
+    image.pixels.foreach_set(pixels.ravel())
+    image.update()
+    tag_update(image)
+    return image
+
+
+def field_grid(scene, handles):
+    # (columns, rows) of the field images
+    columns, rows = pin_grid(scene, handles)
+    return min(columns, FIELD_MAX_SIZE), min(rows, FIELD_MAX_SIZE)
+
+
+def lattice_uvs(columns, rows):
+    # centers of the lattice cells across the plane, 0 to 1, bottom row first
+    # like the field images
+    u, v = numpy.meshgrid((numpy.arange(columns) + 0.5) / columns, (numpy.arange(rows) + 0.5) / rows)
+    return numpy.stack([u.ravel(), v.ravel()], axis=1)
+
+
+def lattice_points(handles, columns, rows):
+    # the cell centers in the plane's space, homogeneous
+    low, high = plane_bounds(handles.plane.data)
+    points = numpy.ones((columns * rows, 4), dtype=numpy.float32)
+    points[:, :2] = low[:2] + lattice_uvs(columns, rows) * (high[:2] - low[:2])
+    points[:, 2] = low[2]
+    return points
+
+
+def lattice_heights(scene, handles, columns, rows):
+    # the height texture at every cell center, 0 to 1, assuming it spans the
+    # plane's extent; None without a height texture
+    if handles.inputs["height_texture"].default_value is None:
+        return None
+    return texture_heights(scene, handles, lattice_uvs(columns, rows))
+
+
+def field_vector(tree, location):
+    # the pin's position across the plane's extent, 0 to 1, the way the field
+    # images span it
+    position, offset, scale = (tree.nodes.get(name) for name in FIELD_VECTOR_NODES)
+    if scale is None:
+        position = tree.nodes.new("GeometryNodeInputPosition")
+        offset = tree.nodes.new("ShaderNodeVectorMath")
+        offset.operation = 'SUBTRACT'
+        scale = tree.nodes.new("ShaderNodeVectorMath")
+        scale.operation = 'DIVIDE'
+        for index, (node, name) in enumerate(zip((position, offset, scale), FIELD_VECTOR_NODES)):
+            node.name = node.label = name
+            node.location = location[0] + 200 * index, location[1]
+        tree.links.new(position.outputs[0], offset.inputs[0])
+        tree.links.new(offset.outputs[0], scale.inputs[0])
+    return scale.outputs[0]
+
+
+def update_field_vector(handles):
+    # the plane's extent may have been edited
+    tree = handles.inputs["height_texture"].node.id_data
+    offset, scale = (tree.nodes.get(name) for name in FIELD_VECTOR_NODES[1:])
+    if scale is None:
+        return
+    low, high = plane_bounds(handles.plane.data)
+    low = (float(low[0]), float(low[1]), 0.0)
+    size = (float(max(high[0] - low[0], 1e-6)), float(max(high[1] - low[1], 1e-6)), 1.0)
+    if tuple(offset.inputs[1].default_value) != low:
+        offset.inputs[1].default_value = low
+    if tuple(scale.inputs[1].default_value) != size:
+        scale.inputs[1].default_value = size
+
+
+def field_lookup(handles, name, image, location):
+    # Image Texture node reading image at the pin's lattice cell
+    tree = handles.inputs["height_texture"].node.id_data
+    node = tree.nodes.get(name)
+    if node is None:
+        node = tree.nodes.new("GeometryNodeImageTexture")
+        node.name = node.label = name
+        node.interpolation = 'Closest'
+        node.extension = 'EXTEND'
+        node.location = location
+        vector = field_vector(tree, (location[0] - 600, location[1] - 200))
+        tree.links.new(vector, node.inputs["Vector"])
+        update_field_vector(handles)
+    node.inputs["Image"].default_value = image
+    return node
+
+
+def assign_field_image(handles, name, image):
+    # the lookup may have been spliced before its image was first written
+    node = handles.inputs["height_texture"].node.id_data.nodes.get(name)
+    if node is not None and node.inputs["Image"].default_value != image:
+        node.inputs["Image"].default_value = image
+
+
+def remove_field_nodes(tree, names):
+    # the named nodes, and the shared vector once nothing reads it
+    for name in names:
+        node = tree.nodes.get(name)
+        if node is not None:
+            tree.nodes.remove(node)
+    scale = tree.nodes.get(FIELD_VECTOR_NODES[2])
+    if scale is not None and not scale.outputs[0].links:
+        for name in FIELD_VECTOR_NODES:
+            tree.nodes.remove(tree.nodes[name])
+
+
+# textures shrunk to what the pin grid can show, written to GRID_TEXTURE_DIR
+# next to the .blend; the shrunk image remembers its original's path in
+# GRID_TEXTURE_SOURCE so full resolution textures can be put back
+GRID_TEXTURE_DIR = "//pixels_textures"
+GRID_TEXTURE_SOURCE = "pixels_source"
+# texels per pin kept along each axis
+GRID_TEXTURE_OVERSAMPLE = 2
+
+
+def grid_texture_size(scene, handles, size):
+    # the pins of the finer of the viewport and the render lattice
+    columns, rows = pin_grid(scene, handles)
+    width = columns * GRID_TEXTURE_OVERSAMPLE
+    height = rows * GRID_TEXTURE_OVERSAMPLE
+    return min(width, size[0]), min(height, size[1])
+
+
+def grid_texture(image, width, height):
+    # area averaged copy of image no larger than width x height, cached on disk
+    source = bpy.path.abspath(image.filepath)
+    block = (max(1, image.size[1] // height), max(1, image.size[0] // width))
+    if block == (1, 1):
+        return image
+    # float, 16 bit (loaded as float) and non-color images, e.g. height maps,
+    # keep their precision in a full float EXR instead of an 8 bit PNG
+    is_data = image.colorspace_settings.is_data
+    precise = image.is_float or is_data
+    stat = os.stat(source)
+    key = hashlib.sha256(repr((source, stat.st_mtime, stat.st_size, block,
+                               image.colorspace_settings.name, precise)).encode()).hexdigest()[:16]
+    path = os.path.join(bpy.path.abspath(GRID_TEXTURE_DIR), "{}_{}{}".format(
+        bpy.path.clean_name(os.path.splitext(image.name)[0]), key, ".exr" if precise else ".png"))
+    if not os.path.exists(path):
+        pixels = block_average(image_array(image), block)
+        small = bpy.data.images.new(os.path.basename(path), pixels.shape[1], pixels.shape[0],
+                                    alpha=image.channels == 4, float_buffer=precise, is_data=is_data)
+        small.pixels.foreach_set(pixels.astype(numpy.float32).ravel())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        small.filepath_raw = path
+        if precise:
+            small.file_format = 'OPEN_EXR'
+            small.use_half_precision = False
+        else:
+            small.file_format = 'PNG'
+        small.save()
+        bpy.data.images.remove(small)
+    small = bpy.data.images.load(path, check_existing=True)
+    if not image.is_float or is_data:
+        # float pixels are already scene linear, as an EXR loads by default
+        small.colorspace_settings.name = image.colorspace_settings.name
+    small[GRID_TEXTURE_SOURCE] = image.filepath
+    small["pixels_source_size"] = tuple(image.size)
+    small["pixels_grid_size"] = (width, height)
+    # the full resolution pixels aren't needed until the original is put back
+    image.buffers_free()
+    return small
+
+
+def grid_texture_slots(scene, handles):
+    # (owner, attribute, pixelation it follows or None) of every image the
+    # pins sample
+    slots = [(handles.inputs["height_texture"], "default_value", None),
+             (handles.inputs["color_texture"], "default_value", PIXELATION)]
+    for mat in bpy.data.materials:
+        if contains_keyword(EXTRA_INSTANCE_KW, mat.name):
+            pixelation = EXTRA_PIXELATION
+        elif contains_keyword(BASIC_INSTANCE_KW, mat.name):
+            pixelation = PIXELATION
+        else:
+            continue
+        texture_node = mat.node_tree.nodes.get("Image Texture") if mat.node_tree else None
+        if texture_node is not None:
+            slots.append((texture_node, "image", pixelation))
+    return slots
+
+
+def original_image(image):
+    source = image.get(GRID_TEXTURE_SOURCE)
+    return bpy.data.images.load(source, check_existing=True) if source else image
+
+
+# images made in memory (not in GRID_TEXTURE_DIR) are marked with this and
+# packed when the file is saved, see pack_generated_images()
+GENERATED_IMAGE = "pixels_generated"
+# pixelation block a pixelated texture was made for
+PIXELATED_BLOCK = "pixels_block"
+
+
+def pixelated_texture(image, pixelation, block):
+    # copy of image pixelated into blocks of block texels, interpolated from
+    # the texture's pyramid and rewritten in place while the pixelation moves
+    pixels = pixelated_field(image, None, block)
+    height, width, channels = pixels.shape
+    if channels < 4:
+        pixels = numpy.concatenate(
+            [pixels, numpy.ones((height, width, 4 - channels), dtype=pixels.dtype)], axis=2)
+    name = "{} {}".format(image.name, pixelation[1])
+    is_data = image.colorspace_settings.is_data
+    pixelated = bpy.data.images.get(name)
+    if pixelated is None:
+        pixelated = bpy.data.images.new(name, width, height, alpha=True,
+                                        float_buffer=image.is_float or is_data, is_data=is_data)
+        if not image.is_float or is_data:
+            pixelated.colorspace_settings.name = image.colorspace_settings.name
+        pixelated[GENERATED_IMAGE] = True
+        pixelated[GRID_TEXTURE_SOURCE] = image.filepath
+    elif tuple(pixelated.size) != (width, height):
+        pixelated.scale(width, height)
+    pixelated.pixels.foreach_set(pixels.astype(numpy.float32).ravel())
+    pixelated.update()
+    pixelated["pixels_source_size"] = tuple(image.size)
+    pixelated[PIXELATED_BLOCK] = round(block, 3)
+    return pixelated
+
+
+def refresh_grid_textures(scene):
+    # swap every sampled texture for its grid sized copy, pixelated ones for
+    # a copy pixelated from the texture's pyramid, or back when
+    # use_grid_textures is off; packed and generated images are left alone
+    handles = scene_handles()
+    for owner, attribute, pixelation in grid_texture_slots(scene, handles):
+        image = getattr(owner, attribute)
+        if image is None:
+            continue
+        shrunk = GRID_TEXTURE_SOURCE in image
+        block = pixelation_block(scene, pixelation) if pixelation else 1.0
+        if not scene.use_grid_textures:
+            replacement = original_image(image)
+        elif not shrunk and not (image.filepath and image.packed_file is None):
+            continue
+        elif block > 1.0:
+            if image.get(PIXELATED_BLOCK) == round(block, 3):
+                continue
+            replacement = pixelated_texture(original_image(image), pixelation, block)
+            # rewritten in place when it already was the pixelated copy
+            tag_update(handles.plane)
+        else:
+            size = tuple(image["pixels_source_size"]) if shrunk else tuple(image.size)
+            target = grid_texture_size(scene, handles, size)
+            if shrunk and PIXELATED_BLOCK not in image and tuple(image["pixels_grid_size"]) == target:
+                continue
+            replacement = grid_texture(original_image(image), *target)
+        if replacement != image:
+            setattr(owner, attribute, replacement)
+            tag_update(handles.plane)
+
+
+@persistent
+def pack_generated_images(*args):
+    # images made in memory would come back empty without their pixels
+    for image in bpy.data.images:
+        if image.get(GENERATED_IMAGE) and (image.is_dirty or image.packed_file is None):
+            image.file_format = 'OPEN_EXR' if image.is_float else 'PNG'
+            image.pack()
+
+
+def use_grid_textures_set(self, context):
+    refresh_grid_textures(bpy.context.scene)
+
+
+# visibility from the culling camera of every lattice cell, computed with
+# numpy into a field image; the Instancing Nodes delete the pins whose cell
+# reads hidden right after the FrustumCullingGroup, which is muted while this
+# mask replaces it
+VISIBLE_IMAGE = "pixels_visible"
+CULLING_MASK_NODES = ("Cached Culling Mask", "Cached Culling Hidden", "Cached Culling Delete")
+CULLING_CACHE_SIZE = 8
+
+# camera pose -> mask, an animation going back and forth reuses its masks
+_culling_masks = collections.OrderedDict()
+_culling_key = None
+# _culling_key while the all-visible mask of a missing camera is written
+NO_CAMERA_KEY = "no camera"
+
+
+def camera_clip_matrix(scene, camera, depsgraph):
+    width, height = poster_size(scene)
+    projection = camera.calc_matrix_camera(depsgraph, x=width, y=height,
+                                           scale_x=scene.render.pixel_aspect_x,
+                                           scale_y=scene.render.pixel_aspect_y)
+    return numpy.array(projection @ camera.matrix_world.inverted(), dtype=numpy.float32)
+
+
+def frustum_mask(points, clip_matrix, margin):
+    # inside the view, widened by margin (of the view size) on every side
+    clip = points @ clip_matrix.T
+    w = clip[:, 3]
+    limit = w * (1.0 + 2.0 * margin)
+    return ((w > 0.0) & (numpy.abs(clip[:, 0]) <= limit) & (numpy.abs(clip[:, 1]) <= limit)
+            & (clip[:, 2] <= w))
+
+
+def culling_key(scene, handles, camera):
+    data = camera.data
+    return (tuple(value for row in camera.matrix_world for value in row),
+            tuple(value for row in handles.plane.matrix_world for value in row),
+            data.type, data.lens, data.ortho_scale, data.sensor_fit, data.sensor_width,
+            data.sensor_height, data.shift_x, data.shift_y, data.clip_end, poster_size(scene),
+            field_grid(scene, handles),
+            tuple(float(value) for corner in plane_bounds(handles.plane.data) for value in corner),
+            scene.culling_margin)
+
+
+# corners of the pin top (in pin widths around its center) that have to be
+# hidden for the pin to count as occluded, the center included
+OCCLUSION_CORNERS = ((0.0, 0.0), (-0.5, -0.5), (0.5, -0.5), (-0.5, 0.5), (0.5, 0.5))
+# march step in lattice cells, finer than a cell so the rays don't skip the
+# pins between the gaps
+OCCLUSION_STEP = 0.25
+OCCLUSION_MAX_STEPS = 1024
+OCCLUSION_CHUNK = 4096
+
+
+def pin_heights(scene, handles, columns, rows):
+    # height of the pin top of every lattice cell in the plane's space
+    heights = None if scene.keep_base_height else lattice_heights(scene, handles, columns, rows)
+    if heights is None:
+        fill = 1.0 if scene.keep_base_height else 0.0
+        heights = numpy.full(columns * rows, fill, dtype=numpy.float32)
+    return heights * scene.detail_height * scene.detail_height_multiplier
+
+
+def height_signature(scene, handles):
+    image = handles.inputs["height_texture"].default_value
+    return (image_key(image) if image else None, scene.sampling_mode, scene.use_pixelation,
+            round(scene.pixelation, 3),
+            handles.inputs["height_texture"].node.interpolation, scene.keep_base_height,
+            scene.use_baked_height,
+            _baked_height_key, scene.detail_height, scene.detail_height_multiplier)
+
+
+def occlusion_mask(points, heights, camera_position, margin, tested, solid=1.0):
+    # march from the pin tops towards the camera over the height field, a pin
+    # is occluded when taller pins block the rays of its center and all four
+    # top corners; a pin only fills the central solid fraction of its cell, a
+    # ray through the gap around it is not blocked
+    xs, ys = numpy.unique(points[:, 0]), numpy.unique(points[:, 1])
+    ix, iy = numpy.searchsorted(xs, points[:, 0]), numpy.searchsorted(ys, points[:, 1])
+    grid = numpy.full((len(ys), len(xs)), -numpy.inf, dtype=numpy.float32)
+    grid[iy, ix] = heights
+    highest = heights.max()
+    pitch_x = (xs[-1] - xs[0]) / max(len(xs) - 1, 1) or 1.0
+    pitch_y = (ys[-1] - ys[0]) / max(len(ys) - 1, 1) or 1.0
+    camera_x = (camera_position[0] - xs[0]) / pitch_x
+    camera_y = (camera_position[1] - ys[0]) / pitch_y
+    camera_z = camera_position[2]
+    half = 0.5 * solid
+
+    # only the tested pins are marched, every pin can block them
+    occluded = numpy.ones(len(tested), dtype=bool)
+    for start in range(0, len(tested), OCCLUSION_CHUNK):
+        chunk = slice(start, start + OCCLUSION_CHUNK)
+        own = tested[chunk]
+        own_x, own_y = ix[own], iy[own]
+        top = heights[own] + margin
+        for corner_x, corner_y in OCCLUSION_CORNERS:
+            x0, y0 = own_x + corner_x * solid, own_y + corner_y * solid
+            dx, dy = camera_x - x0, camera_y - y0
+            length = numpy.maximum(numpy.hypot(dx, dy), 1e-6)
+            # steps until the ray is above the tallest pin or at the camera
+            rise = numpy.maximum(camera_z - top, 1e-6)
+            reach = numpy.minimum(length, length * numpy.maximum(highest - top, 0.0) / rise)
+            steps = int(min(OCCLUSION_MAX_STEPS, numpy.ceil(reach.max() / OCCLUSION_STEP)))
+            if steps < 1:
+                occluded[chunk] = False
+                break
+            t = (numpy.arange(1, steps + 1, dtype=numpy.float32)[None, :] * OCCLUSION_STEP
+                 / length[:, None])
+            sample_x = x0[:, None] + t * dx[:, None]
+            sample_y = y0[:, None] + t * dy[:, None]
+            cell_x = numpy.rint(sample_x).astype(int)
+            cell_y = numpy.rint(sample_y).astype(int)
+            inside = ((t < 1.0) & (cell_x >= 0) & (cell_x < len(xs)) & (cell_y >= 0) & (cell_y < len(ys))
+                      & ((cell_x != own_x[:, None]) | (cell_y != own_y[:, None]))
+                      & (numpy.abs(sample_x - cell_x) <= half) & (numpy.abs(sample_y - cell_y) <= half))
+            ray_z = top[:, None] + t * (camera_z - top)[:, None]
+            blocker = grid[numpy.clip(cell_y, 0, len(ys) - 1), numpy.clip(cell_x, 0, len(xs) - 1)]
+            occluded[chunk] &= (inside & (blocker > ray_z)).any(axis=1)
+    return occluded
+
+
+def pin_solid(scene):
+    # the fraction of a lattice cell a pin fills along each axis, the rest is
+    # the gap
+    detail_size = min(scene.detail_size, scene.render_detail_size)
+    return detail_size / max(detail_size + scene.gap_size, 1e-6)
+
+
+def culling_mask(scene, handles, camera, key, depsgraph):
+    # visibility of every lattice cell, rows x columns
+    mask = _culling_masks.get(key)
+    if mask is None:
+        columns, rows = field_grid(scene, handles)
+        local_points = lattice_points(handles, columns, rows)
+        plane_matrix = numpy.array(handles.plane.matrix_world, dtype=numpy.float32)
+        if scene.use_frustum_culling:
+            clip_matrix = camera_clip_matrix(scene, camera, depsgraph)
+            mask = frustum_mask(local_points @ plane_matrix.T, clip_matrix, scene.culling_margin)
+        else:
+            mask = numpy.ones(len(local_points), dtype=bool)
+        if scene.use_occlusion_culling:
+            # in the plane's space, where the heights are; only pins still
+            # visible are marched
+            camera_position = numpy.linalg.inv(plane_matrix) @ numpy.append(
+                numpy.array(camera.matrix_world.translation), 1.0)
+            visible = numpy.flatnonzero(mask)
+            heights = local_points[:, 2] + pin_heights(scene, handles, columns, rows)
+            occluded = occlusion_mask(local_points[:, :2], heights, camera_position[:3],
+                                      scene.occlusion_margin, visible, pin_solid(scene))
+            mask[visible[occluded]] = False
+        mask = mask.reshape(rows, columns)
+        _culling_masks[key] = mask
+        while len(_culling_masks) > CULLING_CACHE_SIZE:
+            _culling_masks.popitem(last=False)
+    _culling_masks.move_to_end(key)
+    return mask
+
+
+def refresh_culling_mask(scene, depsgraph=None):
+    # write the mask only when the camera pose (or the lattice) changed, a
+    # static camera costs one key comparison per frame
+    global _culling_key
+    if not scene.use_cached_culling:
+        return
+    handles = scene_handles()
+    update_field_vector(handles)
+    camera = handles.inputs["culling_camera"].default_value
+    if camera is None or camera.type != 'CAMERA':
+        # nothing is culled without a camera, the mask of the last one is
+        # replaced
+        key = (NO_CAMERA_KEY, field_grid(scene, handles))
+        if _culling_key != key:
+            columns, rows = key[1]
+            write_visible(handles, numpy.ones((rows, columns), dtype=bool))
+            _culling_key = key
+        return
+    if depsgraph is not None:
+        # the pose evaluated for the current frame
+        camera = camera.evaluated_get(depsgraph)
+    key = (scene.use_frustum_culling, scene.use_occlusion_culling) + culling_key(scene, handles, camera)
+    if scene.use_occlusion_culling:
+        key += (scene.occlusion_margin, pin_solid(scene)) + height_signature(scene, handles)
+    if key == _culling_key:
+        return
+    if scene.use_frustum_culling or scene.use_occlusion_culling:
+        mask = culling_mask(scene, handles, camera, key,
+                            depsgraph or bpy.context.evaluated_depsgraph_get())
+    else:
+        columns, rows = field_grid(scene, handles)
+        mask = numpy.ones((rows, columns), dtype=bool)
+    write_visible(handles, mask)
+    _culling_key = key
+
+
+def write_visible(handles, mask):
+    image = field_image(VISIBLE_IMAGE, mask.astype(numpy.float32))
+    assign_field_image(handles, CULLING_MASK_NODES[0], image)
+
+
+def splice_culling_mask(handles, enabled):
+    # Delete Geometry after the FrustumCullingGroup, selecting the pins whose
+    # cell of the mask reads hidden
+    group_node = handles.inputs["culling_camera"].node
+    tree = group_node.id_data
+    geometry_output = next(socket for socket in group_node.outputs if socket.type == 'GEOMETRY')
+    delete_node = tree.nodes.get(CULLING_MASK_NODES[2])
+    if enabled and delete_node is None:
+        x, y = group_node.location.x, group_node.location.y - 250
+        mask_node = field_lookup(handles, CULLING_MASK_NODES[0], bpy.data.images.get(VISIBLE_IMAGE),
+                                 (x, y))
+        hidden_node = tree.nodes.new("FunctionNodeCompare")
+        hidden_node.data_type = 'FLOAT'
+        hidden_node.operation = 'LESS_THAN'
+        hidden_node.inputs[1].default_value = 0.5
+        delete_node = tree.nodes.new("GeometryNodeDeleteGeometry")
+        delete_node.domain = 'POINT'
+        for offset, (node, name) in enumerate(zip((hidden_node, delete_node), CULLING_MASK_NODES[1:])):
+            node.name = node.label = name
+            node.location = x + 200 * (offset + 1), y
+        tree.links.new(mask_node.outputs["Color"], hidden_node.inputs[0])
+        tree.links.new(hidden_node.outputs["Result"], delete_node.inputs["Selection"])
+        for link in list(geometry_output.links):
+            tree.links.new(delete_node.outputs["Geometry"], link.to_socket)
+        tree.links.new(geometry_output, delete_node.inputs["Geometry"])
+        group_node.mute = True
+    elif not enabled and delete_node is not None:
+        for link in list(delete_node.outputs["Geometry"].links):
+            tree.links.new(geometry_output, link.to_socket)
+        remove_field_nodes(tree, CULLING_MASK_NODES)
+        group_node.mute = False
+
+
+def culling_margin_set(self, context):
+    refresh_culling_mask(bpy.context.scene)
+
+
+def use_cached_culling_set(self, context):
+    global _culling_key
     scene = bpy.context.scene
-    bg_color_node = bpy.data.worlds["World"].node_tree.nodes["Background Color"]
-    bg_color_node.inputs[0].default_value = scene.background_color
-
-
-def contains_keyword(keyword, string):
-    return keyword.upper() in string.upper()
-
-
-def extra_plane_color_set(self, context):
+    handles = scene_handles()
+    _culling_key = None
+    refresh_culling_mask(scene)
+    splice_culling_mask(handles, scene.use_cached_culling)
+    update_frame_handler(scene)
+    tag_update(handles.plane)
+
+
+# level of detail of every lattice cell, 0 the base object, 1 its proxy, 2 a
+# flat quad, from the pin's projected size in the culling camera, in a field
+# image; the Instancing Nodes pick the instance by the level of the pin's cell
+# instead of switching on use_base_proxy_object
+LOD_IMAGE = "pixels_lod"
+LOD_NODES = ("LOD Field", "LOD Index", "LOD Instances", "LOD Quad", "LOD Quad Transform")
+_lod_levels = None
+_lod_key = None
+
+
+def lod_levels(points, clip_matrix, right, footprint, thresholds, hysteresis, previous):
+    # a pin moves to a coarser level once it is hysteresis below a threshold
+    # and back once it is hysteresis above it, in between it keeps its level
+    clip = points @ clip_matrix.T
+    w = numpy.maximum(clip[:, 3], 1e-6)
+    size = numpy.abs(footprint * (clip_matrix[0, :3] @ right)) / w
+    thresholds = numpy.array(thresholds, dtype=numpy.float32)
+    coarsest = (size[:, None] < thresholds * (1.0 - hysteresis)).sum(axis=1)
+    finest = (size[:, None] < thresholds * (1.0 + hysteresis)).sum(axis=1)
+    if previous is None or len(previous) != len(points):
+        return (size[:, None] < thresholds).sum(axis=1).astype(numpy.int32)
+    return numpy.clip(previous, coarsest, finest).astype(numpy.int32)
+
+
+def pin_footprint(handles, columns, rows):
+    # world space width of one lattice cell
+    dimensions = handles.plane.dimensions
+    return max(dimensions.x / columns, dimensions.y / rows)
+
+
+def refresh_lod_levels(scene, depsgraph=None):
+    global _lod_levels, _lod_key
+    if not scene.use_lod:
+        return
+    handles = scene_handles()
+    camera = handles.inputs["culling_camera"].default_value
+    # the base object may have been edited
+    update_lod_quad(handles)
+    update_field_vector(handles)
+    if camera is None or camera.type != 'CAMERA':
+        return
+    if depsgraph is not None:
+        camera = camera.evaluated_get(depsgraph)
+    proxy = handles.inputs["base_proxy_object"].default_value
+    key = culling_key(scene, handles, camera) + (scene.lod_proxy_size, scene.lod_quad_size,
+                                                 scene.lod_hysteresis, proxy is None)
+    if key == _lod_key:
+        return
+    width, height = poster_size(scene)
+    clip_matrix = camera_clip_matrix(scene, camera, depsgraph or bpy.context.evaluated_depsgraph_get())
+    columns, rows = field_grid(scene, handles)
+    points = lattice_points(handles, columns, rows) @ numpy.array(handles.plane.matrix_world,
+                                                                  dtype=numpy.float32).T
+    # the thresholds are in pixels, the clip space spans two units
+    right = numpy.array(camera.matrix_world.col[0][:3], dtype=numpy.float32)
+    footprint = pin_footprint(handles, columns, rows) * width / 2.0
+    levels = lod_levels(points, clip_matrix, right, footprint,
+                        (scene.lod_proxy_size, scene.lod_quad_size), scene.lod_hysteresis,
+                        _lod_levels)
+    _lod_levels = levels
+    if proxy is None:
+        # nothing between the base object and the quad
+        levels = numpy.where(levels == 1, 0, levels)
+    image = field_image(LOD_IMAGE, levels.reshape(rows, columns).astype(numpy.float32))
+    assign_field_image(handles, LOD_NODES[0], image)
+    _lod_key = key
+
+
+def update_lod_quad(handles):
+    # a quad covering the top of the base object, where its top face is
+    base_object = handles.inputs["base_object"].default_value
+    tree = handles.inputs["base_object"].node.id_data
+    quad_node, transform_node = (tree.nodes.get(name) for name in LOD_NODES[3:])
+    if base_object is None or quad_node is None:
+        return
+    corners = numpy.array([corner[:] for corner in base_object.bound_box], dtype=numpy.float32)
+    low, high = corners.min(axis=0), corners.max(axis=0)
+    size_x, size_y = float(high[0] - low[0]), float(high[1] - low[1])
+    translation = (float(low[0] + high[0]) / 2.0, float(low[1] + high[1]) / 2.0, float(high[2]))
+    if (quad_node.inputs["Size X"].default_value != size_x
+            or quad_node.inputs["Size Y"].default_value != size_y
+            or tuple(transform_node.inputs["Translation"].default_value) != translation):
+        quad_node.inputs["Size X"].default_value = size_x
+        quad_node.inputs["Size Y"].default_value = size_y
+        transform_node.inputs["Translation"].default_value = translation
+
+
+def downstream_node(socket, idname, depth=8):
+    # first node of type idname the socket feeds, following geometry links
+    for link in socket.links:
+        if link.to_node.bl_idname == idname:
+            return link.to_node, link.to_socket
+        if depth > 0:
+            for output in link.to_node.outputs:
+                if output.type == 'GEOMETRY':
+                    found = downstream_node(output, idname, depth - 1)
+                    if found is not None:
+                        return found
+    return None
+
+
+def splice_lod(handles, enabled):
+    # replace the base/proxy switch by a Geometry to Instance of the base
+    # object, the proxy and the quad, picked per pin by the level of its cell
+    proxy_node = handles.inputs["base_proxy_object"].node
+    base_node = handles.inputs["base_object"].node
+    tree = proxy_node.id_data
+    instances_node = tree.nodes.get(LOD_NODES[2])
+    if enabled and instances_node is None:
+        proxy_output = proxy_node.outputs["Geometry"]
+        switch_node = next(link.to_node for link in proxy_output.links)
+        switch_output = next(output for output in switch_node.outputs
+                             if output.enabled and output.type == 'GEOMETRY')
+        instance_node, instance_socket = downstream_node(switch_output,
+                                                         "GeometryNodeInstanceOnPoints")
+        x, y = switch_node.location.x, switch_node.location.y - 250
+        field_node = field_lookup(handles, LOD_NODES[0], bpy.data.images.get(LOD_IMAGE), (x, y))
+        index_node = tree.nodes.new("FunctionNodeFloatToInt")
+        index_node.rounding_mode = 'ROUND'
+        instances_node = tree.nodes.new("GeometryNodeGeometryToInstance")
+        quad_node = tree.nodes.new("GeometryNodeMeshGrid")
+        quad_node.inputs["Vertices X"].default_value = 2
+        quad_node.inputs["Vertices Y"].default_value = 2
+        transform_node = tree.nodes.new("GeometryNodeTransform")
+        for offset, (node, name) in enumerate(zip((index_node, instances_node, quad_node,
+                                                   transform_node), LOD_NODES[1:])):
+            node.name = node.label = name
+            node.location = x + 200 * (offset + 1), y
+        # the order of the links is the instance index
+        tree.links.new(base_node.outputs["Geometry"], instances_node.inputs["Geometry"])
+        tree.links.new(proxy_output, instances_node.inputs["Geometry"])
+        tree.links.new(quad_node.outputs["Mesh"], transform_node.inputs["Geometry"])
+        tree.links.new(transform_node.outputs["Geometry"], instances_node.inputs["Geometry"])
+        for link in list(switch_output.links):
+            tree.links.new(instances_node.outputs["Instances"], link.to_socket)
+        tree.links.new(field_node.outputs["Color"], index_node.inputs[0])
+        tree.links.new(index_node.outputs[0], instance_node.inputs["Instance Index"])
+        instance_node.inputs["Pick Instance"].default_value = True
+        update_lod_quad(handles)
+    elif not enabled and instances_node is not None:
+        proxy_output = proxy_node.outputs["Geometry"]
+        switch_node = next(link.to_node for link in proxy_output.links
+                           if link.to_node != instances_node)
+        switch_output = next(output for output in switch_node.outputs
+                             if output.enabled and output.type == 'GEOMETRY')
+        found = downstream_node(instances_node.outputs["Instances"], "GeometryNodeInstanceOnPoints")
+        for link in list(instances_node.outputs["Instances"].links):
+            tree.links.new(switch_output, link.to_socket)
+        if found is not None:
+            found[0].inputs["Pick Instance"].default_value = False
+        remove_field_nodes(tree, LOD_NODES)
+
+
+def lod_set(self, context):
+    refresh_lod_levels(bpy.context.scene)
+
+
+def use_lod_set(self, context):
+    global _lod_levels, _lod_key
     scene = bpy.context.scene
-    mat = scene.extra_plane_material
-    plane_material_node = mat.node_tree.nodes.get("RGB")
-    if plane_material_node is not None:
-        plane_material_node.outputs[0].default_value = scene.extra_plane_color
+    handles = scene_handles()
+    _lod_levels = _lod_key = None
+    refresh_lod_levels(scene)
+    splice_lod(handles, scene.use_lod)
+    update_frame_handler(scene)
+    tag_update(handles.plane)
+
+
+# rough memory of one instance (transform, reference, id) and of one
+# realized triangle (positions, normals, corner data)
+INSTANCE_BYTES = 96
+TRIANGLE_BYTES = 80
+# bisection steps of the detail size fit
+FIT_ITERATIONS = 20
+
+# (mesh, polygon count) -> triangles
+_triangle_counts = {}
+
+
+def grid_size(scene, handles, detail_size):
+    # pins per row/column of the lattice, thinned out by the sparse grid
+    columns, rows = pin_grid(scene, handles, detail_size)
+    return (max(1, int(round(columns * (1.0 - scene.sparse_grid_x / 100.0)))),
+            max(1, int(round(rows * (1.0 - scene.sparse_grid_y / 100.0)))))
+
+
+def object_triangles(obj):
+    if obj is None or obj.type != 'MESH':
+        return 0
+    polygons = obj.data.polygons
+    key = (obj.data.as_pointer(), len(polygons), len(obj.data.loops))
+    if key not in _triangle_counts:
+        totals = numpy.empty(len(polygons), dtype=numpy.int32)
+        polygons.foreach_get("loop_total", totals)
+        _triangle_counts[key] = int(totals.sum()) - 2 * len(polygons)
+    return _triangle_counts[key]
+
+
+# heights of the lattice pins, sorted, and their histogram; the threshold only
+# moves a cut through them, so scrubbing it counts without sampling again
+HISTOGRAM_BINS = 32
+HISTOGRAM_BLOCKS = " \u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
+_height_histogram = None
+
+
+def height_histogram(scene, handles):
+    # (sorted heights in percent, counts per bin), None without a height texture
+    global _height_histogram
+    image = handles.inputs["height_texture"].default_value
+    if image is None:
+        return None
+    key = image_key(image) + (scene.sampling_mode,
+           scene.use_pixelation, round(scene.pixelation, 3),
+           handles.inputs["height_texture"].node.interpolation, scene.use_baked_height,
+           _baked_height_key, field_grid(scene, handles))
+    if _height_histogram is None or _height_histogram[0] != key:
+        columns, rows = key[-1]
+        percent = numpy.sort(lattice_heights(scene, handles, columns, rows) * 100.0)
+        counts, _ = numpy.histogram(percent, bins=HISTOGRAM_BINS, range=(0.0, 100.0))
+        _height_histogram = (key, percent, counts)
+    return _height_histogram[1:]
+
+
+def extra_instance_count(percent, threshold, threshold_mode):
+    # pins that get an extra object: heights (in percent, sorted) above or
+    # below the threshold
+    if threshold_mode == 'GREATER':
+        return len(percent) - int(numpy.searchsorted(percent, threshold, side='right'))
+    return int(numpy.searchsorted(percent, threshold, side='left'))
+
+
+def histogram_text(counts, threshold):
+    # one block character per bin, the threshold marked between the bins
+    levels = len(HISTOGRAM_BLOCKS) - 1
+    heights = numpy.ceil(counts / max(counts.max(), 1) * levels).astype(int)
+    blocks = [HISTOGRAM_BLOCKS[height] for height in heights]
+    blocks.insert(int(round(threshold / 100.0 * len(blocks))), "|")
+    return "".join(blocks)
+
+
+def instanced_objects(scene, handles):
+    base_object = handles.inputs["base_object"].default_value
+    extra_object = handles.inputs["extra_object"].default_value
+    if scene.use_base_proxy_object and scene.base_proxy_object is not None:
+        base_object = scene.base_proxy_object
+    if scene.use_extra_proxy_object and scene.extra_proxy_object is not None:
+        extra_object = scene.extra_proxy_object
+    return base_object, extra_object
+
+
+def pin_counts(scene, handles, realized, detail_size):
+    # (base instances, extra instances): the lattice pins kept by the sparse
+    # grid, and the share of them the extra object threshold picks; extra
+    # objects only exist on realized geometry
+    columns, rows = grid_size(scene, handles, detail_size)
+    base = columns * rows
+    extra = 0
+    histogram = height_histogram(scene, handles)
+    if realized and scene.use_extra_object and histogram is not None and len(histogram[0]):
+        percent = histogram[0]
+        picked = extra_instance_count(percent, scene.extra_object_threshold, scene.threshold_mode)
+        extra = int(round(picked * base / len(percent)))
+    return base, extra
+
+
+def instance_estimate(scene, handles, realized, detail_size):
+    # (base instances, extra instances, triangles, bytes) the node tree would
+    # produce at detail_size, without evaluating it
+    base_object, extra_object = instanced_objects(scene, handles)
+    base, extra = pin_counts(scene, handles, realized, detail_size)
+    triangles = base * object_triangles(base_object) + extra * object_triangles(extra_object)
+    memory = (base + extra) * INSTANCE_BYTES + (triangles * TRIANGLE_BYTES if realized else 0)
+    return base, extra, triangles, memory
+
+
+def viewport_realized(scene):
+    return not scene.use_instances_only
+
+
+def render_realized(scene):
+    return not scene.use_instances_only or scene.realize_on_render
+
+
+# fit target -> (detail size setting it writes, realized, instance budget,
+# memory budget)
+FIT_TARGETS = {
+    'VIEWPORT': ("detail_size", viewport_realized, "viewport_instance_budget",
+                 "viewport_memory_budget"),
+    'RENDER': ("render_detail_size", render_realized, "render_instance_budget",
+               "render_memory_budget"),
+}
+
+
+def fit_detail_size(scene, handles, target):
+    # (detail size, fits) with the finest detail (the most pins) whose
+    # estimate fits the target's budget; the pin count only goes down as the
+    # detail size grows
+    name, realized, instance_budget, memory_budget = FIT_TARGETS[target]
+    realized = realized(scene)
+    memory = scene.fit_budget_mode == 'MEMORY'
+    budget = getattr(scene, memory_budget) * 1024 ** 2 if memory else getattr(scene, instance_budget)
+
+    def fits(detail_size):
+        estimate = instance_estimate(scene, handles, realized, detail_size)
+        if memory:
+            return estimate[3] <= budget
+        return estimate[0] + estimate[1] <= budget
+
+    prop_args = SETTINGS_BY_NAME[name].prop_args
+    low, high = prop_args["min"], prop_args["max"]
+    if fits(low):
+        return low, True
+    if not fits(high):
+        return high, False
+    for _ in range(FIT_ITERATIONS):
+        middle = (low + high) / 2.0
+        if fits(middle):
+            high = middle
+        else:
+            low = middle
+    return math.ceil(high * 100.0) / 100.0, True
 
-    if scene.use_extra_plane:
-        plane = bpy.data.objects["Plane"]
-        plane.update_tag()
 
+SAMPLING_MODE_ITEMS = (('ALL', 'All Channels', ''),
+                       ('RED', 'Red', ''),
+                       ('GREEN', 'Green', ''),
+                       ('BLUE', 'Blue', ''))
 
-def floor_color_set(self, context):
-    scene = bpy.context.scene
-    mat = scene.floor_material
-    floor_material_node = mat.node_tree.nodes.get("RGB")
-    if floor_material_node is not None:
-        floor_material_node.outputs[0].default_value = scene.floor_color
+SHADING_MODE_ITEMS = (('VERTEX', 'Vertex Color', ''),
+                      ('TEXTURED', 'Textured', ''),
+                      )
 
-    plane = bpy.data.objects["Plane"]
-    plane.update_tag()
+BOOLEAN_OPERATION_ITEMS = (('DIFFERENCE', 'Difference', ''),
+                           ('INTERSECT', 'Intersect', ''),
+                           )
 
+THRESHOLD_MODE_ITEMS = (('GREATER', 'Greater Than', ''),
+                        ('LESS', 'Less Than', ''),
+                        )
 
-def frame_color_set(self, context):
-    scene = bpy.context.scene
-    mat = scene.frame_material
-    frame_material_node = mat.node_tree.nodes.get("RGB")
-    if frame_material_node is not None:
-        frame_material_node.outputs[0].default_value = scene.frame_color
+FIT_BUDGET_MODE_ITEMS = (('INSTANCES', 'Instances', ''),
+                         ('MEMORY', 'Memory', ''),
+                         )
 
-    if scene.active_frame_object is not None:
-        plane = bpy.data.objects["Plane"]
-        plane.update_tag()
+BACKGROUND_MODE_ITEMS = (('COLOR', 'Solid Color', ''),
+                         ('TEXTURE', 'Environment Texture', ''),)
 
+# enum item -> "Settings" modifier input value
+SAMPLING_MODE_VALUES = {'ALL': 0, 'RED': 1, 'GREEN': 2, 'BLUE': 3}
+SHADING_MODE_VALUES = {'VERTEX': 0, 'TEXTURED': 1}
+THRESHOLD_MODE_VALUES = {'GREATER': 1, 'LESS': 0}
+BACKGROUND_MODE_VALUES = {'COLOR': 0, 'TEXTURE': 1}
 
-def set_to_initial_frame(self, context):
-    scene = bpy.context.scene
-    scene.frame_set(scene.frame_current)
+# feature toggles gating whole layers
+EXTRA_OBJECT = ("use_extra_object",)
+EXTRA_GLASS = ("use_extra_glass",)
+EXTRA_PLANE = ("use_extra_plane",)
+BOOLEAN = ("use_boolean",)
 
 
-classes = (VIEW3D_PT_viewport_optimization_settings, VIEW3D_PT_quick_settings,
-           VIEW3D_PT_grid_settings, VIEW3D_PT_instance_objects,
-           VIEW3D_PT_base_scale, VIEW3D_PT_base_rotation, VIEW3D_PT_base_shading,
-           VIEW3D_PT_environment, VIEW3D_PT_extra_location, VIEW3D_PT_extra_scale,
-           VIEW3D_PT_extra_rotation, VIEW3D_PT_extra_shading, VIEW3D_PT_extra_glass,
-           VIEW3D_PT_extra_plane, VIEW3D_PT_boolean_settings, VIEW3D_PT_frame_settings,
-           VIEW3D_PT_floor_settings, VIEW3D_PT_about,
-           )
+def rgb_node_color(mat):
+    node = mat.node_tree.nodes.get("RGB") if mat is not None else None
+    return node.outputs[0].default_value if node is not None else None
 
 
-def register():
-    for cls in classes:
-        bpy.utils.register_class(cls)
+def world_node_color(handles, handle):
+    return handles.world_nodes[handle].inputs[0].default_value
+
 
-    sampling_mode_items = (('ALL', 'All Channels', ''),
-                           ('RED', 'Red', ''),
-                           ('GREEN', 'Green', ''),
-                           ('BLUE', 'Blue', ''))
+# name, prop_type, prop_args: the scene property, without its update callback
+# socket: "Settings" modifier input the property drives
+# node_input: scene_handles() node input the property drives
+# values: enum item -> socket value
+# gates: toggles of the features the setting belongs to, while any of them is
+#   off the setting is not pushed and waits in _deferred until they are all on
+# update: hand-written update callback used instead of a generated one
+# pushed: getter for what a hand-written callback without a socket last pushed
+Setting = collections.namedtuple(
+    "Setting", ("name", "prop_type", "prop_args", "socket", "node_input",
+                "values", "gates", "update", "pushed"),
+    defaults=(None, None, None, None, None, None))
 
-    bpy.types.Scene.sampling_mode = bpy.props.EnumProperty(
+SETTINGS = (
+    Setting("sampling_mode", EnumProperty, dict(
         name="sampling_mode",
-        items=sampling_mode_items,
+        items=SAMPLING_MODE_ITEMS,
         default='ALL',
         description="Change Sampling Mode (All Channels, Red, Green, Blue)",
-        update=sampling_mode_enum_set
-    )
-
-    bpy.app.handlers.frame_change_pre.append(sampling_mode_enum_set)
-
-    shading_mode_items = (('VERTEX', 'Vertex Color', ''),
-                          ('TEXTURED', 'Textured', ''),
-                          )
-
-    bpy.types.Scene.shading_mode = bpy.props.EnumProperty(
+    ), socket="Input_8", values=SAMPLING_MODE_VALUES),
+    Setting("shading_mode", EnumProperty, dict(
         name="shading_mode",
-        items=shading_mode_items,
+        items=SHADING_MODE_ITEMS,
         default='VERTEX',
         description="Change Shading Mode (Vertex, Textured)",
-        update=shading_mode_enum_set,
-    )
-
-    bpy.types.Scene.extra_shading_mode = bpy.props.EnumProperty(
+    ), socket="Input_31", values=SHADING_MODE_VALUES, update=shading_mode_enum_set),
+    Setting("extra_shading_mode", EnumProperty, dict(
         name="extra_shading_mode",
-        items=shading_mode_items,
+        items=SHADING_MODE_ITEMS,
         default='VERTEX',
         description="Change Extra Shading Mode (Vertex, Textured)",
-        update=extra_shading_mode_enum_set,
-    )
-
-    bpy.types.Scene.use_extra_glass = bpy.props.BoolProperty(
+    ), socket="Input_32",
+       values=SHADING_MODE_VALUES,
+       update=extra_shading_mode_enum_set, gates=EXTRA_OBJECT),
+    Setting("use_extra_glass", BoolProperty, dict(
         name="use_extra_glass",
         default=False,
         description="Use Extra Glass",
-        update=use_extra_glass_bool_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_extra_glass_bool_set)
-
-    bpy.types.Scene.pixelation = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_4"),
+    Setting("pixelation", FloatProperty, dict(
         name="pixelation",
         default=200.0,
         min=0.0,
@@ -1508,12 +2586,9 @@ def register():
         soft_min=0.0,
         soft_max=1000.0,
         description="Change Pixelation Amount",
-        update=pixelation_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(pixelation_float_set)
-
-    bpy.types.Scene.extra_pixelation = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_33", gates=("use_pixelation",)),
+    Setting("extra_pixelation", FloatProperty, dict(
         name="extra_pixelation",
         default=200.0,
         min=0.0,
@@ -1521,12 +2596,9 @@ def register():
         soft_min=0.0,
         soft_max=1000.0,
         description="Change Extra Pixelation Amount",
-        update=extra_pixelation_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_pixelation_float_set)
-
-    bpy.types.Scene.detail_size = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_34", gates=EXTRA_OBJECT + ("use_extra_pixelation",)),
+    Setting("detail_size", FloatProperty, dict(
         name="detail_size",
         default=10.0,
         min=1.0,
@@ -1534,12 +2606,9 @@ def register():
         soft_min=1.0,
         soft_max=100.0,
         description="Detail Size",
-        update=detail_size_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(detail_size_float_set)
-
-    bpy.types.Scene.render_detail_size = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_2"),
+    Setting("render_detail_size", FloatProperty, dict(
         name="render_detail_size",
         default=4.0,
         min=1.0,
@@ -1547,12 +2616,9 @@ def register():
         soft_min=1.0,
         soft_max=100.0,
         description="Render Detail Size",
-        update=render_detail_size_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(render_detail_size_float_set)
-
-    bpy.types.Scene.detail_height = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_40"),
+    Setting("detail_height", FloatProperty, dict(
         name="detail_height",
         default=20,
         min=1.0,
@@ -1560,12 +2626,9 @@ def register():
         soft_min=1.0,
         soft_max=100,
         description="Detail Height",
-        update=detail_height_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(detail_height_float_set)
-
-    bpy.types.Scene.detail_height_multiplier = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_3"),
+    Setting("detail_height_multiplier", FloatProperty, dict(
         name="detail_height",
         default=1,
         min=1.0,
@@ -1573,13 +2636,9 @@ def register():
         soft_min=1.0,
         soft_max=100,
         description="Detail Height Multiplier",
-        update=detail_height_multiplier_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(
-        detail_height_multiplier_float_set)
-
-    bpy.types.Scene.extra_glass_width = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_62"),
+    Setting("extra_glass_width", FloatProperty, dict(
         name="extra_glass_width",
         default=3,
         min=1.0,
@@ -1587,198 +2646,138 @@ def register():
         soft_min=1.0,
         soft_max=100,
         description="Extra Glass Width",
-        update=extra_glass_width_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_glass_width_float_set)
-
-    bpy.types.Scene.use_pixelation = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_5", gates=EXTRA_GLASS),
+    Setting("use_pixelation", BoolProperty, dict(
         name="use_pixelation",
         default=True,
         description="Use Pixelation for Image Texture",
-        update=use_pixelation_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_pixelation_set)
-
-    bpy.types.Scene.use_extra_pixelation = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_16"),
+    Setting("use_extra_pixelation", BoolProperty, dict(
         name="use_extra_pixelation",
         default=True,
         description="Use Extra Pixelation for Image Texture",
-        update=use_extra_pixelation_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_extra_pixelation_set)
-
-    bpy.types.Scene.extra_object_threshold = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_25", gates=EXTRA_OBJECT),
+    Setting("extra_object_threshold", FloatProperty, dict(
         name="extra_object_threshold ",
         default=50.0,
         min=-0.0,
         max=100.0,
         description="Height Threshold to control extra object placement",
-        update=extra_object_threshold_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_object_threshold_float_set)
-
-    bpy.types.Scene.use_extra_object = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_17", gates=EXTRA_OBJECT),
+    Setting("use_extra_object", BoolProperty, dict(
         name="use_extra_object",
         default=True,
         description="Use extra object on top of base instances",
-        update=use_extra_object_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_extra_object_set)
-
-    bpy.types.Scene.gap_size = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_18"),
+    Setting("gap_size", FloatProperty, dict(
         name="gap_size",
         default=1.0,
         min=0.0,
         max=100.0,
         description="Gap Size between instances",
-        update=gap_size_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(gap_size_float_set)
-
-    bpy.types.Scene.negative_size_x = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_21"),
+    Setting("negative_size_x", FloatProperty, dict(
         name="negative_size_x",
         default=0.0,
         min=0.0,
         max=100.0,
         description="Negative Size X",
-        update=negative_size_x_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(negative_size_x_float_set)
-
-    bpy.types.Scene.negative_size_y = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_19"),
+    Setting("negative_size_y", FloatProperty, dict(
         name="negative_size_y",
         default=0.0,
         min=0.0,
         max=100.0,
         description="Negative Size Y",
-        update=negative_size_y_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(negative_size_y_float_set)
-
-    bpy.types.Scene.keep_extra_scale = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_20"),
+    Setting("keep_extra_scale", BoolProperty, dict(
         name="keep_extra_scale",
         default=True,
         description="Keep the scale of extra objects",
-        update=keep_extra_scale_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(keep_extra_scale_set)
-
-    bpy.types.Scene.offset_z = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_22", gates=EXTRA_OBJECT),
+    Setting("offset_z", FloatProperty, dict(
         name="offset_z",
         default=0.0,
         min=-100.0,
         max=100.0,
         description="Extra Object Offset Z",
-        update=offset_z_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(offset_z_float_set)
-
-    bpy.types.Scene.use_frustum_culling = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_23", gates=EXTRA_OBJECT),
+    Setting("use_frustum_culling", BoolProperty, dict(
         name="use_frustum_culling",
         default=False,
-        description=(
-            "Use Frustum Culling in viewport to improve performance.\n"
-            "(messes up vertex colors, useful while blocking in shapes)"
-        ),
-        update=use_frustum_culling_set,
-    )
-
-    bpy.types.Scene.culling_camera = bpy.props.PointerProperty(
+        description="Use Frustum Culling in viewport to improve performance.\n"
+        "(messes up vertex colors, useful while blocking in shapes)",
+    ), socket="Input_26"),
+    Setting("culling_camera", PointerProperty, dict(
         name="culling_camera",
         description="Camera to use for frustum culling",
         type=bpy.types.Camera,
-        update=culling_camera_set,
-    )
-
-    bpy.types.Scene.use_instances_only = bpy.props.BoolProperty(
+    ), update=culling_camera_set, gates=("use_frustum_culling",)),
+    Setting("use_instances_only", BoolProperty, dict(
         name="use_instances_only",
         default=True,
         description="Use instances instead of realizing geometry (vertex color and extra object won't work)",
-        update=use_instances_only_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_instances_only_set)
-
-    bpy.types.Scene.sparse_grid_x = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_27", update=use_instances_only_set),
+    Setting("sparse_grid_x", FloatProperty, dict(
         name="sparse_grid_x",
         default=0.0,
         min=0.0,
         max=100.0,
         description="Reduce the vertices of the grid/plane (X), used as points to instance on",
-        update=sparse_grid_x_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(sparse_grid_x_float_set)
-
-    bpy.types.Scene.sparse_grid_y = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_28"),
+    Setting("sparse_grid_y", FloatProperty, dict(
         name="sparse_grid_y",
         default=0.0,
         min=0.0,
         max=100.0,
         description="Reduce the vertices of the grid/plane (Y), used as points to instance on",
-        update=sparse_grid_y_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(sparse_grid_y_float_set)
-
-    bpy.types.Scene.use_extra_plane = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_29"),
+    Setting("use_extra_plane", BoolProperty, dict(
         name="use_extra_plane",
         default=True,
         description="Use Extra Plane",
-        update=use_extra_plane_bool_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_extra_plane_bool_set)
-
-    boolean_operation_items = (('DIFFERENCE', 'Difference', ''),
-                               ('INTERSECT', 'Intersect', ''),
-                               )
-
-    bpy.types.Scene.boolean_operation = bpy.props.EnumProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_30"),
+    Setting("boolean_operation", EnumProperty, dict(
         name="boolean_operation",
-        items=boolean_operation_items,
+        items=BOOLEAN_OPERATION_ITEMS,
         default='DIFFERENCE',
-        update=boolean_operation_enum_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(boolean_operation_enum_set)
-
-    bpy.types.Scene.use_boolean = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), update=boolean_operation_enum_set,
+       pushed=lambda scene, handles: handles.boolean.operation, gates=BOOLEAN),
+    Setting("use_boolean", BoolProperty, dict(
         name="use_boolean",
         default=True,
         description="Use Boolean Operation",
-        update=use_boolean_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_boolean_set)
-
-    bpy.types.Scene.base_material = bpy.props.PointerProperty(
+        options={'ANIMATABLE'},
+    ), update=use_boolean_set,
+       pushed=lambda scene, handles: handles.boolean.show_viewport),
+    Setting("base_material", PointerProperty, dict(
         name="base_material",
         description="Base Material",
         type=bpy.types.Material,
-        update=base_material_set,
         poll=base_material_poll,
-    )
-
-    bpy.types.Scene.extra_material = bpy.props.PointerProperty(
+    ), node_input="base_material"),
+    Setting("extra_material", PointerProperty, dict(
         name="extra_material",
         description="Extra Material",
         type=bpy.types.Material,
-        update=extra_material_set,
         poll=extra_material_poll,
-    )
-
-    bpy.types.Scene.bevel_size = bpy.props.FloatProperty(
+    ), node_input="extra_material", gates=EXTRA_OBJECT),
+    Setting("bevel_size", FloatProperty, dict(
         name="bevel_size",
         default=5.0,
         min=0.0,
@@ -1786,12 +2785,12 @@ def register():
         soft_min=0.0,
         soft_max=100.0,
         description="Material based bevel size (Cycles Only)",
-        update=bevel_size_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(bevel_size_float_set)
-
-    bpy.types.Scene.extra_bevel_size = bpy.props.FloatProperty(
+        options={'ANIMATABLE'},
+    # ungated: the base material bevels in every shading and instancing mode,
+    # only the render engine turns it off and that isn't a toggle whose
+    # setter could release a held back write
+    ), socket="Input_36"),
+    Setting("extra_bevel_size", FloatProperty, dict(
         name="extra_bevel_size",
         default=5.0,
         min=0.0,
@@ -1799,27 +2798,20 @@ def register():
         soft_min=0.0,
         soft_max=100.0,
         description="Material based bevel size for Extra Object (Cycles Only)",
-        update=extra_bevel_size_float_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_bevel_size_float_set)
-
-    bpy.types.Scene.realize_on_render = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_37", gates=EXTRA_OBJECT),
+    Setting("realize_on_render", BoolProperty, dict(
         name="realize_on_render",
         default=False,
         description="Realize instances when rendering",
-        update=realize_on_render_set
-    )
-
-    bpy.types.Scene.active_frame_object = bpy.props.PointerProperty(
+    ), socket="Input_38"),
+    Setting("active_frame_object", PointerProperty, dict(
         name="active_frame_object",
         description="Currently active frame object",
         type=bpy.types.Object,
-        update=active_frame_object_set,
         poll=active_frame_object_poll,
-    )
-
-    bpy.types.Scene.frame_scale_offset = bpy.props.FloatProperty(
+    ), node_input="frame_object"),
+    Setting("frame_scale_offset", FloatProperty, dict(
         name="frame_scale_offset",
         default=1.0,
         min=1.0,
@@ -1827,162 +2819,114 @@ def register():
         soft_min=1.0,
         soft_max=100.0,
         description="Extra Glass scale XY offset",
-        update=frame_scale_offset_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(frame_scale_offset_set)
-
-    bpy.types.Scene.frame_material = bpy.props.PointerProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_39"),
+    Setting("frame_material", PointerProperty, dict(
         name="frame_material",
         description="Frame Material",
         type=bpy.types.Material,
-        update=frame_material_set,
         poll=frame_material_poll,
-    )
-
-    bpy.types.Scene.floor_material = bpy.props.PointerProperty(
+    ), update=frame_material_set),
+    Setting("floor_material", PointerProperty, dict(
         name="floor_material",
         description="Floor Material",
         type=bpy.types.Material,
-        update=floor_material_set,
         poll=floor_material_poll,
-    )
-
-    bpy.types.Scene.extra_glass_material = bpy.props.PointerProperty(
+    ), update=floor_material_set),
+    Setting("extra_glass_material", PointerProperty, dict(
         name="extra_glass_material",
         description="Extra Glass Material",
         type=bpy.types.Material,
-        update=extra_glass_material_set,
         poll=extra_glass_material_poll,
-    )
-
-    bpy.types.Scene.extra_plane_material = bpy.props.PointerProperty(
+    ), update=extra_glass_material_set, gates=EXTRA_GLASS),
+    Setting("extra_plane_material", PointerProperty, dict(
         name="extra_plane_material",
         description="Extra Plane Material",
         type=bpy.types.Material,
-        update=extra_plane_material_set,
         poll=extra_plane_material_poll,
-    )
-
-    bpy.types.Scene.use_random_rotation = bpy.props.BoolProperty(
+    ), update=extra_plane_material_set, gates=EXTRA_PLANE),
+    Setting("use_random_rotation", BoolProperty, dict(
         name="use_random_rotation",
         default=False,
         description="Use Random Rotation",
-        update=use_random_rotation_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_random_rotation_set)
-
-    bpy.types.Scene.snap_rotation = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_41"),
+    Setting("snap_rotation", BoolProperty, dict(
         name="snap_rotation",
         default=False,
         description="Snap rotation to 90 degree increments",
-        update=snap_rotation_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(snap_rotation_set)
-
-    bpy.types.Scene.use_extra_random_rotation = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_42", gates=("use_random_rotation",)),
+    Setting("use_extra_random_rotation", BoolProperty, dict(
         name="use_extra_random_rotation",
         default=False,
         description="Use Extra Random Rotation",
-        update=use_extra_random_rotation_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_extra_random_rotation_set)
-
-    bpy.types.Scene.extra_snap_rotation = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_43", gates=EXTRA_OBJECT),
+    Setting("extra_snap_rotation", BoolProperty, dict(
         name="extra_snap_rotation",
         default=False,
         description="Snap Extra Object's rotation to 90 degree increments",
-        update=extra_snap_rotation_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_snap_rotation_set)
-
-    bpy.types.Scene.extra_scale_offset = bpy.props.FloatVectorProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_44", gates=EXTRA_OBJECT + ("use_extra_random_rotation",)),
+    Setting("extra_scale_offset", FloatVectorProperty, dict(
         name="extra_scale_offset",
         subtype='XYZ',
         default=(0.0, 0.0, 0.0),
         min=0.0,
         max=100.0,
         description="Extra Object scale offset",
-        update=extra_scale_offset_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_scale_offset_set)
-
-    bpy.types.Scene.use_extra_random_scale = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_45", gates=EXTRA_OBJECT),
+    Setting("use_extra_random_scale", BoolProperty, dict(
         name="use_extra_random_scale",
         default=False,
         description="Extra Object random scale",
-        update=use_extra_random_scale_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_extra_random_scale_set)
-
-    bpy.types.Scene.extra_random_scale_min = bpy.props.FloatVectorProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_46", gates=EXTRA_OBJECT),
+    Setting("extra_random_scale_min", FloatVectorProperty, dict(
         name="extra_random_scale_min",
         subtype='XYZ',
         default=(0.0, 0.0, 0.0),
         min=0.0,
         max=100.0,
         description="Extra Object random scale min",
-        update=extra_random_scale_min_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_random_scale_min_set)
-
-    bpy.types.Scene.extra_random_scale_max = bpy.props.FloatVectorProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_47", gates=EXTRA_OBJECT + ("use_extra_random_scale",)),
+    Setting("extra_random_scale_max", FloatVectorProperty, dict(
         name="extra_random_scale_max",
         subtype='XYZ',
         default=(0.0, 0.0, 0.0),
         min=0.0,
         max=100.0,
         description="Extra Object random scale max",
-        update=extra_random_scale_max_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_random_scale_max_set)
-
-    threshold_items = (('GREATER', 'Greater Than', ''),
-                       ('LESS', 'Less Than', ''),
-                       )
-
-    bpy.types.Scene.threshold_mode = bpy.props.EnumProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_48", gates=EXTRA_OBJECT + ("use_extra_random_scale",)),
+    Setting("threshold_mode", EnumProperty, dict(
         name="threshold_mode",
-        items=threshold_items,
+        items=THRESHOLD_MODE_ITEMS,
         default='GREATER',
-        update=threshold_mode_enum_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(threshold_mode_enum_set)
-
-    bpy.types.Scene.active_base_object = bpy.props.PointerProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_49", values=THRESHOLD_MODE_VALUES, gates=EXTRA_OBJECT),
+    Setting("active_base_object", PointerProperty, dict(
         name="active_base_object",
         description="Currently active base instance object",
         type=bpy.types.Object,
-        update=active_base_object_set,
         poll=active_base_object_poll,
-    )
-
-    bpy.types.Scene.active_extra_object = bpy.props.PointerProperty(
+    ), node_input="base_object"),
+    Setting("active_extra_object", PointerProperty, dict(
         name="active_extra_object",
         description="Currently active extra instance object",
         type=bpy.types.Object,
-        update=active_extra_object_set,
         poll=active_extra_object_poll,
-    )
-
-    bpy.types.Scene.active_boolean_object = bpy.props.PointerProperty(
+    ), node_input="extra_object", gates=EXTRA_OBJECT),
+    Setting("active_boolean_object", PointerProperty, dict(
         name="active_boolean_object",
         description="Currently active boolean object",
         type=bpy.types.Object,
-        update=active_boolean_object_set,
         poll=active_boolean_object_poll,
-    )
-
-    bpy.types.Scene.extra_glass_color = bpy.props.FloatVectorProperty(
+    ), update=active_boolean_object_set, gates=BOOLEAN),
+    Setting("extra_glass_color", FloatVectorProperty, dict(
         name="extra_glass_color",
         subtype='COLOR_GAMMA',
         size=4,
@@ -1990,76 +2934,85 @@ def register():
         max=1.0,
         default=(1.0, 1.0, 1.0, 1.0),
         description="Extra Glass Color",
-        update=extra_glass_color_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_glass_color_set)
-
-    bpy.types.Scene.base_proxy_object = bpy.props.PointerProperty(
+        options={'ANIMATABLE'},
+    ), update=extra_glass_color_set,
+       pushed=lambda scene, handles: rgb_node_color(scene.extra_glass_material), gates=EXTRA_GLASS),
+    Setting("base_proxy_object", PointerProperty, dict(
         name="base_proxy_object",
         description="Proxy object for base instance",
         type=bpy.types.Object,
-        update=base_proxy_object_set,
         poll=proxy_object_poll,
-    )
-
-    bpy.types.Scene.extra_proxy_object = bpy.props.PointerProperty(
+    ), node_input="base_proxy_object", gates=("use_base_proxy_object",)),
+    Setting("extra_proxy_object", PointerProperty, dict(
         name="extra_proxy_object",
         description="Proxy object for extra instance",
         type=bpy.types.Object,
-        update=extra_proxy_object_set,
         poll=proxy_object_poll,
-    )
-
-    bpy.types.Scene.use_base_proxy_object = bpy.props.BoolProperty(
+    ), node_input="extra_proxy_object", gates=EXTRA_OBJECT + ("use_extra_proxy_object",)),
+    Setting("use_base_proxy_object", BoolProperty, dict(
         name="use_base_proxy_object",
         default=False,
         description="Use base proxy object",
-        update=use_base_proxy_object_set,
-    )
-
-    bpy.types.Scene.use_extra_proxy_object = bpy.props.BoolProperty(
+    ), socket="Input_55"),
+    Setting("use_extra_proxy_object", BoolProperty, dict(
         name="use_extra_proxy_object",
         default=False,
         description="Use extra proxy object",
-        update=use_extra_proxy_object_set,
-    )
-
-    bpy.types.Scene.use_look_at_rotation = bpy.props.BoolProperty(
+    ), socket="Input_56", gates=EXTRA_OBJECT),
+    Setting("use_lod", BoolProperty, dict(
+        name="use_lod",
+        default=False,
+        description="Instance the base object, its proxy or a flat quad per pin depending on "
+                    "the pin's size in the culling camera",
+    ), update=use_lod_set),
+    Setting("lod_proxy_size", FloatProperty, dict(
+        name="lod_proxy_size",
+        default=24.0,
+        min=0.0,
+        soft_max=200.0,
+        subtype='PIXEL',
+        description="Pins smaller than this in the culling camera use the base proxy object",
+    ), update=lod_set),
+    Setting("lod_quad_size", FloatProperty, dict(
+        name="lod_quad_size",
+        default=4.0,
+        min=0.0,
+        soft_max=50.0,
+        subtype='PIXEL',
+        description="Pins smaller than this in the culling camera are a flat quad",
+    ), update=lod_set),
+    Setting("lod_hysteresis", FloatProperty, dict(
+        name="lod_hysteresis",
+        default=0.15,
+        min=0.0,
+        max=0.9,
+        subtype='FACTOR',
+        description="How far (of the threshold) a pin's size has to cross a threshold before "
+                    "its level changes, keeps pins from flickering between levels in animations",
+    ), update=lod_set),
+    Setting("use_look_at_rotation", BoolProperty, dict(
         name="use_look_at_rotation",
         default=False,
         description="Use Look At Rotation",
-        update=use_look_at_rotation_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_look_at_rotation_set)
-
-    bpy.types.Scene.look_at_object = bpy.props.PointerProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_57"),
+    Setting("look_at_object", PointerProperty, dict(
         name="look_at_object",
         description="Look At Object",
         type=bpy.types.Object,
-        update=look_at_object_set,
-        # poll=look_at_object_poll,
-    )
-
-    bpy.types.Scene.use_extra_look_at_rotation = bpy.props.BoolProperty(
+    ), node_input="look_at_object", gates=("use_look_at_rotation",)),
+    Setting("use_extra_look_at_rotation", BoolProperty, dict(
         name="use_extra_look_at_rotation",
         default=False,
         description="Use Extra Look At Rotation",
-        update=use_extra_look_at_rotation_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(use_extra_look_at_rotation_set)
-
-    bpy.types.Scene.extra_look_at_object = bpy.props.PointerProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_59", gates=EXTRA_OBJECT),
+    Setting("extra_look_at_object", PointerProperty, dict(
         name="extra_look_at_object",
         description="Extra Look At Object",
         type=bpy.types.Object,
-        update=extra_look_at_object_set,
-        # poll=look_at_object_poll,
-    )
-
-    bpy.types.Scene.extra_location_offset_z = bpy.props.FloatProperty(
+    ), node_input="extra_look_at_object", gates=EXTRA_OBJECT + ("use_extra_look_at_rotation",)),
+    Setting("extra_location_offset_z", FloatProperty, dict(
         name="extra_location_offset_z",
         default=0.0,
         min=-1000.0,
@@ -2067,34 +3020,22 @@ def register():
         soft_min=-100.0,
         soft_max=100.0,
         description="Extra Object Location Offset Z",
-        update=extra_location_offset_z_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_location_offset_z_set)
-
-    bpy.types.Scene.keep_base_height = bpy.props.BoolProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_58", gates=EXTRA_OBJECT),
+    Setting("keep_base_height", BoolProperty, dict(
         name="keep_base_height",
         default=False,
         description="Keep Base Height",
-        update=keep_base_height_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(keep_base_height_set)
-
-    background_mode_items = (('COLOR', 'Solid Color', ''),
-                             ('TEXTURE', 'Environment Texture', ''),)
-
-    bpy.types.Scene.background_mode = bpy.props.EnumProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_60"),
+    Setting("background_mode", EnumProperty, dict(
         name="background_mode",
-        items=background_mode_items,
+        items=BACKGROUND_MODE_ITEMS,
         default='COLOR',
         description="Mode to use for world background",
-        update=background_mode_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(background_mode_set)
-
-    bpy.types.Scene.background_color = bpy.props.FloatVectorProperty(
+        options={'ANIMATABLE'},
+    ), socket="Input_61", values=BACKGROUND_MODE_VALUES),
+    Setting("background_color", FloatVectorProperty, dict(
         name="background_color",
         subtype='COLOR_GAMMA',
         size=4,
@@ -2102,12 +3043,10 @@ def register():
         max=1.0,
         default=(0.0, 0.0, 0.0, 1.0),
         description="Background Color",
-        update=background_color_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(background_color_set)
-
-    bpy.types.Scene.extra_plane_color = bpy.props.FloatVectorProperty(
+        options={'ANIMATABLE'},
+    ), update=background_color_set,
+       pushed=lambda scene, handles: world_node_color(handles, "background_color")),
+    Setting("extra_plane_color", FloatVectorProperty, dict(
         name="extra_plane_color",
         subtype='COLOR_GAMMA',
         size=4,
@@ -2115,12 +3054,10 @@ def register():
         max=1.0,
         default=(1.0, 1.0, 1.0, 1.0),
         description="Extra Plane Color",
-        update=extra_plane_color_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(extra_plane_color_set)
-
-    bpy.types.Scene.floor_color = bpy.props.FloatVectorProperty(
+        options={'ANIMATABLE'},
+    ), update=extra_plane_color_set,
+       pushed=lambda scene, handles: rgb_node_color(scene.extra_plane_material), gates=EXTRA_PLANE),
+    Setting("floor_color", FloatVectorProperty, dict(
         name="floor_color",
         subtype='COLOR_GAMMA',
         size=4,
@@ -2128,12 +3065,10 @@ def register():
         max=1.0,
         default=(1.0, 1.0, 1.0, 1.0),
         description="Floor Color",
-        update=floor_color_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(floor_color_set)
-
-    bpy.types.Scene.frame_color = bpy.props.FloatVectorProperty(
+        options={'ANIMATABLE'},
+    ), update=floor_color_set,
+       pushed=lambda scene, handles: rgb_node_color(scene.floor_material)),
+    Setting("frame_color", FloatVectorProperty, dict(
         name="frame_color",
         subtype='COLOR_GAMMA',
         size=4,
@@ -2141,85 +3076,1539 @@ def register():
         max=1.0,
         default=(1.0, 1.0, 1.0, 1.0),
         description="Frame Color",
-        update=frame_color_set,
-        options={'ANIMATABLE'}
-    )
-    bpy.app.handlers.frame_change_pre.append(frame_color_set)
+        options={'ANIMATABLE'},
+    ), update=frame_color_set,
+       pushed=lambda scene, handles: rgb_node_color(scene.frame_material)),
+    Setting("input_debounce", FloatProperty, dict(
+        name="input_debounce",
+        default=0.15,
+        min=0.0,
+        max=2.0,
+        subtype='TIME_ABSOLUTE',
+        unit='TIME_ABSOLUTE',
+        description="Idle time to wait before slider changes are applied to the geometry (0 applies every change)",
+    )),
+    Setting("flush_on_release", BoolProperty, dict(
+        name="flush_on_release",
+        default=True,
+        description="Apply pending slider changes as soon as the mouse button is released",
+    )),
+    Setting("fit_budget_mode", EnumProperty, dict(
+        name="fit_budget_mode",
+        items=FIT_BUDGET_MODE_ITEMS,
+        default='INSTANCES',
+        description="What the detail sizes are fitted to",
+    )),
+    Setting("viewport_instance_budget", IntProperty, dict(
+        name="viewport_instance_budget",
+        default=250000,
+        min=1,
+        description="Instances the detail size is fitted to",
+    )),
+    Setting("render_instance_budget", IntProperty, dict(
+        name="render_instance_budget",
+        default=2000000,
+        min=1,
+        description="Instances the render detail size is fitted to",
+    )),
+    Setting("viewport_memory_budget", FloatProperty, dict(
+        name="viewport_memory_budget",
+        default=512.0,
+        min=1.0,
+        description="Estimated memory (MB) the detail size is fitted to",
+    )),
+    Setting("render_memory_budget", FloatProperty, dict(
+        name="render_memory_budget",
+        default=4096.0,
+        min=1.0,
+        description="Estimated memory (MB) the render detail size is fitted to",
+    )),
+    Setting("use_grid_textures", BoolProperty, dict(
+        name="use_grid_textures",
+        default=False,
+        description="Shrink the textures the pins sample to the resolution of the pin grid, "
+                    "the originals stay on disk and are put back when this is turned off",
+    ), update=use_grid_textures_set),
+    Setting("use_cached_culling", BoolProperty, dict(
+        name="use_cached_culling",
+        default=False,
+        description="Compute frustum culling with NumPy once per camera pose instead of "
+                    "on every evaluation of the node tree",
+    ), update=use_cached_culling_set),
+    Setting("culling_margin", FloatProperty, dict(
+        name="culling_margin",
+        default=0.05,
+        min=0.0,
+        max=1.0,
+        subtype='FACTOR',
+        description="Keep pins this far (of the view size) outside the view, "
+                    "e.g. tall pins leaning into it",
+    ), update=culling_margin_set),
+    Setting("use_occlusion_culling", BoolProperty, dict(
+        name="use_occlusion_culling",
+        default=False,
+        description="Also drop pins hidden behind taller pins between them and the culling camera",
+    ), update=culling_margin_set),
+    Setting("occlusion_margin", FloatProperty, dict(
+        name="occlusion_margin",
+        default=0.1,
+        min=0.0,
+        soft_max=10.0,
+        subtype='DISTANCE',
+        description="Height a pin is raised by before testing whether it's occluded, "
+                    "larger keeps more pins",
+    ), update=culling_margin_set),
+    Setting("use_baked_height", BoolProperty, dict(
+        name="use_baked_height",
+        default=False,
+        description="Sample the height texture once with NumPy and store the heights on the plane "
+                    "instead of sampling the texture on every evaluation",
+    ), update=use_baked_height_set),
+    Setting("use_native_drivers", BoolProperty, dict(
+        name="use_native_drivers",
+        default=False,
+        description="Animate the geometry with drivers on the modifier inputs instead of a "
+                    "Python frame handler, e.g. for render nodes without Python auto-exec",
+    ), update=use_native_drivers_set),
+)
+
+# setting -> toggles of other features that use it too, any of them on opens
+# its gates
+ALTERNATE_GATES = {
+    "culling_camera": ("use_cached_culling", "use_occlusion_culling", "use_lod"),
+    "base_proxy_object": ("use_lod",),
+}
+
+GATE_TOGGLES = ({gate for setting in SETTINGS if setting.gates for gate in setting.gates}
+                | {gate for gates in ALTERNATE_GATES.values() for gate in gates})
+
+# settings changed while their feature was off, pushed when it's turned on
+_deferred = set()
+
+SETTINGS_BY_NAME = {setting.name: setting for setting in SETTINGS}
+
+# settings with keyframes or drivers in the scene, and those of them the
+# frame handler looks at (the rest is driven natively)
+_animated = ()
+_animated_settings = ()
+
+
+def input_value(scene, setting):
+    value = getattr(scene, setting.name)
+    if setting.values is not None:
+        return setting.values[value]
+    if isinstance(value, bool):
+        return 1 if value else 0
+    return value
+
+
+def gate_open(scene, setting):
+    # with native drivers the saved modifier has to hold every value, a render
+    # node without Python can't release what was held back
+    return (setting.gates is None or scene.use_native_drivers
+            or all(getattr(scene, gate) for gate in setting.gates)
+            or any(getattr(scene, gate) for gate in ALTERNATE_GATES.get(setting.name, ())))
+
+
+def write_node_input(node_input, value):
+    if node_input.default_value == value:
+        return False
+    node_input.default_value = value
+    return True
+
+
+# settings the baked height field is made from
+BAKED_HEIGHT_SETTINGS = {"sampling_mode", "use_pixelation", "pixelation"}
+# settings the grid texture resolution depends on
+GRID_TEXTURE_SETTINGS = {"use_pixelation", "pixelation", "use_extra_pixelation", "extra_pixelation",
+                         "detail_size", "render_detail_size", "gap_size"}
+
+
+def make_setter(setting):
+    if setting.socket is not None:
+        def update(self, context):
+            scene = bpy.context.scene
+            queue_input(scene_handles().plane, setting.socket, input_value(scene, setting))
+            if setting.name in BAKED_HEIGHT_SETTINGS:
+                refresh_baked_height(scene)
+            if setting.name in GRID_TEXTURE_SETTINGS and scene.use_grid_textures:
+                refresh_grid_textures(scene)
+            if setting.name == "use_frustum_culling":
+                refresh_culling_mask(scene)
+    elif setting.node_input is not None:
+        def update(self, context):
+            scene = bpy.context.scene
+            write_node_input(scene_handles().inputs[setting.node_input],
+                             getattr(scene, setting.name))
+    else:
+        return None
+    update.__name__ = setting.name + "_set"
+    return update
+
+
+def sync_setting(scene, handles, setting):
+    # push one setting to the scene objects unless they already hold its value
+    if not gate_open(scene, setting):
+        _deferred.add(setting.name)
+        return
+    if setting.update is not None:
+        if setting.socket is not None:
+            pushed = handles.settings.get(setting.socket)
+        elif setting.pushed is not None:
+            pushed = setting.pushed(scene, handles)
+        else:
+            return
+        if pushed is not None and values_differ(pushed, input_value(scene, setting)):
+            setting.update(scene, bpy.context)
+    elif setting.socket is not None:
+        if write_input(handles.settings, setting.socket, input_value(scene, setting)):
+            tag_update(handles.plane)
+    elif setting.node_input is not None:
+        write_node_input(handles.inputs[setting.node_input], getattr(scene, setting.name))
+
+
+def gated_update(setting, update):
+    # hold the setting back while its feature is off, push whatever was held
+    # back once a gate toggle turns its feature on
+    def gated(self, context):
+        scene = bpy.context.scene
+        if gate_open(scene, setting):
+            update(self, context)
+        else:
+            _deferred.add(setting.name)
+        if setting.name in GATE_TOGGLES and _deferred:
+            release_deferred(scene)
+    gated.__name__ = update.__name__
+    return gated
+
+
+def release_deferred(scene):
+    handles = scene_handles()
+    with coalesced_update_tags():
+        flush_pending_inputs()
+        for setting in SETTINGS:
+            if setting.name in _deferred and gate_open(scene, setting):
+                _deferred.discard(setting.name)
+                if setting.update is not None and setting.socket is None and setting.pushed is None:
+                    # nothing to compare against, push it as is
+                    setting.update(scene, bpy.context)
+                else:
+                    sync_setting(scene, handles, setting)
 
-    bpy.app.handlers.render_cancel.append(set_to_initial_frame)
-    bpy.app.handlers.render_complete.append(set_to_initial_frame)
+
+def frame_change_dispatcher(scene, depsgraph=None):
+    # single frame_change_pre handler: push only the animated settings that
+    # differ from what the scene objects already hold, tag the plane at most once
+    handles = scene_handles()
+    with coalesced_update_tags():
+        flush_pending_inputs()
+        for setting in _animated_settings:
+            sync_setting(scene, handles, setting)
+        if _deferred:
+            release_deferred(scene)
+        refresh_baked_height(scene)
+        if scene.use_grid_textures and any(setting.name in GRID_TEXTURE_SETTINGS
+                                           for setting in _animated_settings):
+            # an animated pixelation, served from the textures' pyramids
+            refresh_grid_textures(scene)
+
+
+def camera_frame_handler(scene, depsgraph=None):
+    # frame_change_post handler: the cached culling mask and the levels of
+    # detail follow the culling camera's pose on the new frame, which
+    # frame_change_pre doesn't know yet
+    with coalesced_update_tags():
+        refresh_culling_mask(scene, depsgraph)
+        refresh_lod_levels(scene, depsgraph)
+
+
+# handler list -> handler installed by update_frame_handler() when needed
+FRAME_HANDLERS = (("frame_change_pre", frame_change_dispatcher),
+                  ("frame_change_post", camera_frame_handler))
+
+
+# name of the variable of the drivers installed by sync_native_drivers()
+NATIVE_DRIVER_VAR = "setting"
+
+
+def driver_expression(setting):
+    # expression the driver evaluates without Python, None if it needs Python
+    if setting.values is None:
+        return NATIVE_DRIVER_VAR
+    items = [item[0] for item in setting.prop_args["items"]]
+    if all(setting.values[item] == index for index, item in enumerate(items)):
+        return NATIVE_DRIVER_VAR
+    if all(setting.values[item] == len(items) - 1 - index for index, item in enumerate(items)):
+        return "{} - {}".format(len(items) - 1, NATIVE_DRIVER_VAR)
+    return None
+
+
+def natively_drivable(setting):
+    # settings whose update does more than writing the socket stay on Python,
+    # so do feature toggles, turning one on releases the settings held back
+    # while it was off
+    return (setting.socket is not None and setting.update is None
+            and setting.name not in GATE_TOGGLES and driver_expression(setting) is not None)
+
+
+def setting_size(setting):
+    if setting.prop_type is FloatVectorProperty:
+        return setting.prop_args.get("size", len(setting.prop_args["default"]))
+    return None
+
+
+def is_native_driver(fcurve):
+    return any(var.name == NATIVE_DRIVER_VAR for var in fcurve.driver.variables)
+
+
+# group of the "Settings" input fcurves sync_native_drivers() mirrors from
+# the scene's keyframes onto the plane's action
+NATIVE_MIRROR_GROUP = "3D Pixels Settings"
+KEYFRAME_ARRAYS = ("co", "handle_left", "handle_right")
+KEYFRAME_ENUMS = ("interpolation", "handle_left_type", "handle_right_type", "easing")
+
+# the scene keyframes last mirrored, see mirror_keyframes()
+_mirrored_key = None
+
+
+def socket_mapping(setting):
+    # (scale, offset) taking the scene value to the socket value, the linear
+    # form of driver_expression()
+    if driver_expression(setting) == NATIVE_DRIVER_VAR:
+        return 1.0, 0.0
+    return -1.0, float(len(setting.prop_args["items"]) - 1)
+
+
+def keyframe_signature(fcurve):
+    values = numpy.empty(len(fcurve.keyframe_points) * 2, dtype=numpy.float32)
+    arrays = []
+    for name in KEYFRAME_ARRAYS:
+        fcurve.keyframe_points.foreach_get(name, values)
+        arrays.append(values.tobytes())
+    enums = tuple(getattr(point, name) for point in fcurve.keyframe_points for name in KEYFRAME_ENUMS)
+    return tuple(arrays), enums, fcurve.extrapolation
+
+
+def copy_keyframes(source, target, scale, offset):
+    points = target.keyframe_points
+    count = len(source.keyframe_points)
+    while len(points) > count:
+        points.remove(points[-1], fast=True)
+    points.add(count - len(points))
+    for source_point, point in zip(source.keyframe_points, points):
+        for name in KEYFRAME_ENUMS:
+            setattr(point, name, getattr(source_point, name))
+    values = numpy.empty(count * 2, dtype=numpy.float32)
+    for name in KEYFRAME_ARRAYS:
+        source.keyframe_points.foreach_get(name, values)
+        values[1::2] = values[1::2] * scale + offset
+        points.foreach_set(name, values)
+    target.extrapolation = source.extrapolation
+    target.update()
+
+
+def mirror_keyframes(plane, mirrored):
+    # copy the scene's keyframes of mirrored settings onto fcurves of their
+    # "Settings" inputs, {(path, index): (setting, scene fcurve)}; evaluated
+    # by Blender itself, the scene properties don't need to be registered
+    global _mirrored_key
+    key = tuple(sorted((path, index, keyframe_signature(source))
+                       for (path, index), (setting, source) in mirrored.items()))
+    anim = plane.animation_data
+    action = anim.action if anim is not None else None
+    if key == _mirrored_key and (action is not None or not mirrored):
+        return
+    if action is None:
+        if not mirrored:
+            _mirrored_key = key
+            return
+        anim = anim or plane.animation_data_create()
+        action = anim.action = bpy.data.actions.new(plane.name + "Action")
+    for fcurve in list(action.fcurves):
+        if (fcurve.group is not None and fcurve.group.name == NATIVE_MIRROR_GROUP
+                and (fcurve.data_path, fcurve.array_index) not in mirrored):
+            action.fcurves.remove(fcurve)
+    for (path, index), (setting, source) in mirrored.items():
+        fcurve = action.fcurves.find(path, index=index)
+        if fcurve is None:
+            fcurve = action.fcurves.new(path, index=index, action_group=NATIVE_MIRROR_GROUP)
+        copy_keyframes(source, fcurve, *socket_mapping(setting))
+    _mirrored_key = key
+
+
+def id_property_path(setting, index):
+    # the value as stored on the scene, readable without the script that
+    # registers the property
+    if index is None:
+        return '["{}"]'.format(setting.name)
+    return '["{}"][{}]'.format(setting.name, index)
+
+
+def ensure_id_property(scene, setting):
+    # a property still at its default has nothing stored for a driver to read
+    if setting.name in scene.keys():
+        return
+    value = getattr(scene, setting.name)
+    if setting.values is not None:
+        value = [item[0] for item in setting.prop_args["items"]].index(value)
+    elif setting_size(setting) is not None:
+        value = list(value)
+    elif isinstance(value, bool):
+        value = int(value)
+    scene[setting.name] = value
+
+
+def sync_native_drivers(scene, settings):
+    # move the animation of settings onto their "Settings" inputs: keyframes
+    # of the scene's action are mirrored, anything else (drivers, NLA strips)
+    # is driven from the value stored on the scene; every other setting loses
+    # its mirror and driver
+    plane = scene_handles().plane
+    scene_anim = scene.animation_data
+    keyed = {}
+    if scene_anim is not None and scene_anim.action is not None and not scene_anim.use_nla:
+        keyed = {(fcurve.data_path, fcurve.array_index): fcurve
+                 for fcurve in scene_anim.action.fcurves if not fcurve.mute}
+    mirrored = {}
+    wanted = {}
+    for setting in settings:
+        path = 'modifiers["Settings"]["{}"]'.format(setting.socket)
+        size = setting_size(setting)
+        for index in range(size) if size is not None else (None,):
+            source = keyed.get((setting.name, index or 0))
+            if source is not None:
+                mirrored[path, index or 0] = (setting, source)
+            else:
+                wanted[path, index or 0] = (setting, index)
+    mirror_keyframes(plane, mirrored)
+
+    anim = plane.animation_data
+    existing = set()
+    for fcurve in list(anim.drivers) if anim is not None else ():
+        if not is_native_driver(fcurve):
+            continue
+        key = (fcurve.data_path, fcurve.array_index)
+        target = fcurve.driver.variables[NATIVE_DRIVER_VAR].targets[0]
+        if key in wanted and target.data_path == id_property_path(*wanted[key]):
+            existing.add(key)
+        else:
+            anim.drivers.remove(fcurve)
+
+    for key, (setting, index) in wanted.items():
+        ensure_id_property(scene, setting)
+        if key in existing:
+            continue
+        path = key[0]
+        if index is None:
+            fcurve = plane.driver_add(path)
+        else:
+            fcurve = plane.driver_add(path, index)
+        driver = fcurve.driver
+        driver.type = 'SCRIPTED'
+        var = driver.variables.new()
+        var.name = NATIVE_DRIVER_VAR
+        var.type = 'SINGLE_PROP'
+        var.targets[0].id_type = 'SCENE'
+        var.targets[0].id = scene
+        var.targets[0].data_path = id_property_path(setting, index)
+        driver.expression = driver_expression(setting)
+
+
+def animated_settings(scene):
+    anim = scene.animation_data
+    if anim is None:
+        return ()
+    actions = [anim.action] + [strip.action for track in anim.nla_tracks
+                               for strip in track.strips]
+    fcurves = [fcurve for action in actions if action is not None
+               for fcurve in action.fcurves]
+    fcurves.extend(anim.drivers)
+    data_paths = {fcurve.data_path for fcurve in fcurves if not fcurve.mute}
+    return tuple(setting for setting in SETTINGS if setting.name in data_paths)
+
+
+def update_frame_handler(scene):
+    # install the frame handler only while some setting is animated, a scene
+    # with static settings runs no Python at all on frame change
+    global _animated, _animated_settings
+    _animated = animated_settings(scene)
+    native = ()
+    if scene.use_native_drivers:
+        native = tuple(setting for setting in _animated if natively_drivable(setting))
+    sync_native_drivers(scene, native)
+    _animated_settings = tuple(setting for setting in _animated if setting not in native)
+    needed = frame_handlers(scene)
+    for list_name, handler in FRAME_HANDLERS:
+        handlers = getattr(bpy.app.handlers, list_name)
+        installed = [other for other in handlers if getattr(other, HANDLER_TAG, False)]
+        if (list_name, handler) in needed and not installed:
+            setattr(handler, HANDLER_TAG, True)
+            handlers.append(handler)
+        elif (list_name, handler) not in needed:
+            for other in installed:
+                handlers.remove(other)
+
+
+def frame_handlers(scene):
+    # the frame handlers the scene needs: animated settings, and a cached
+    # culling mask or levels of detail following a possibly animated camera
+    needed = []
+    if _animated_settings:
+        needed.append(FRAME_HANDLERS[0])
+    if scene.use_cached_culling or scene.use_lod:
+        needed.append(FRAME_HANDLERS[1])
+    return needed
+
+
+@persistent
+def watch_animation(scene, depsgraph=None):
+    if depsgraph is None or depsgraph.id_type_updated('NODETREE'):
+        # nodes the handles point into may have been removed or renamed
+        invalidate_scene_handles()
+    # keyframes or drivers were added or removed
+    if depsgraph is None or depsgraph.id_type_updated('ACTION') or depsgraph.id_type_updated('SCENE'):
+        # with native drivers, also keyframes moved that are mirrored
+        if animated_settings(scene) != _animated or scene.use_native_drivers:
+            update_frame_handler(scene)
+    if depsgraph is not None and depsgraph.id_type_updated('IMAGE'):
+        # painted or reloaded images, their cached pyramids are out of date
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.Image):
+                _image_generations[update.id.name] += 1
+    if depsgraph is None or depsgraph.id_type_updated('IMAGE') or depsgraph.id_type_updated('NODETREE'):
+        # e.g. another height texture picked in the panel
+        if scene.use_grid_textures:
+            refresh_grid_textures(scene)
+        refresh_baked_height(scene)
+    if depsgraph is None or depsgraph.id_type_updated('OBJECT') or depsgraph.id_type_updated('CAMERA'):
+        # the culling camera was moved
+        refresh_culling_mask(scene, depsgraph)
+        refresh_lod_levels(scene, depsgraph)
+
+
+@persistent
+def update_frame_handler_on_load(*args):
+    if is_pixels_file():
+        update_frame_handler(bpy.context.scene)
+
+
+def apply_all(scene):
+    # push every setting at once with a single re-evaluation, e.g. after
+    # loading a file or switching a look from a script
+    handles = scene_handles()
+    _deferred.clear()
+    with coalesced_update_tags():
+        flush_pending_inputs()
+        for setting in SETTINGS:
+            sync_setting(scene, handles, setting)
+
+
+@persistent
+def apply_all_on_load(*args):
+    if is_pixels_file():
+        apply_all(bpy.context.scene)
+
+
+@persistent
+def set_to_initial_frame(self, context):
+    scene = bpy.context.scene
+    scene.frame_set(scene.frame_current)
+
+
+classes = (VIEW3D_PT_viewport_optimization_settings, VIEW3D_PT_quick_settings,
+           VIEW3D_PT_grid_settings, VIEW3D_PT_instance_objects,
+           VIEW3D_PT_base_scale, VIEW3D_PT_base_rotation, VIEW3D_PT_base_shading,
+           VIEW3D_PT_environment, VIEW3D_PT_extra_location, VIEW3D_PT_extra_scale,
+           VIEW3D_PT_extra_rotation, VIEW3D_PT_extra_shading, VIEW3D_PT_extra_glass,
+           VIEW3D_PT_extra_plane, VIEW3D_PT_boolean_settings, VIEW3D_PT_frame_settings,
+           VIEW3D_PT_floor_settings, VIEW3D_PT_about,
+           PIXELS_OT_flush_on_release, PIXELS_OT_fit_detail_size,
+           )
+
+
+# handler list -> callbacks, in the order they're appended
+HANDLERS = (("render_init", flush_before_render),
+            ("depsgraph_update_post", watch_animation),
+            ("load_pre", discard_pending_inputs),
+            ("save_pre", pack_generated_images),
+            ("load_post", resolve_scene_handles),
+            ("load_post", apply_all_on_load),
+            ("load_post", update_frame_handler_on_load),
+            ("undo_post", invalidate_scene_handles),
+            ("redo_post", invalidate_scene_handles),
+            ("render_cancel", set_to_initial_frame),
+            ("render_complete", set_to_initial_frame),
+            )
+
+# marks our handlers so a later run of the script can find the ones this
+# run installed, the function objects themselves are recreated every run
+HANDLER_TAG = "_3d_pixels_handler"
+
+
+def installed_handlers():
+    for list_name in dir(bpy.app.handlers):
+        handlers = getattr(bpy.app.handlers, list_name)
+        if isinstance(handlers, list):
+            for handler in handlers:
+                if getattr(handler, HANDLER_TAG, False):
+                    yield handlers, handler
+
+
+def active_handler_count():
+    return sum(1 for _ in installed_handlers())
+
+
+def remove_handlers():
+    for handlers, handler in list(installed_handlers()):
+        handlers.remove(handler)
+
+
+def register():
+    resolve_scene_handles()
+
+    for cls in classes:
+        bpy.utils.register_class(cls)
+
+    for setting in SETTINGS:
+        prop_args = dict(setting.prop_args)
+        update = setting.update or make_setter(setting)
+        if update is not None and (setting.gates or setting.name in GATE_TOGGLES):
+            update = gated_update(setting, update)
+        if update is not None:
+            prop_args["update"] = update
+        setattr(bpy.types.Scene, setting.name, setting.prop_type(**prop_args))
+
+    # running the script again replaces the handlers of the previous run
+    remove_handlers()
+    for list_name, handler in HANDLERS:
+        setattr(handler, HANDLER_TAG, True)
+        getattr(bpy.app.handlers, list_name).append(handler)
+    update_frame_handler(bpy.context.scene)
 
 
 def unregister():
+    remove_handlers()
+    discard_pending_inputs()
+    _deferred.clear()
+
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
-    del bpy.types.Scene.sampling_mode
-    del bpy.types.Scene.shading_mode
-    del bpy.types.Scene.use_extra_glass
-    del bpy.types.Scene.pixelation
-    del bpy.types.Scene.detail_size
-    del bpy.types.Scene.detail_height
-    del bpy.types.Scene.detail_height_multiplier
-    del bpy.types.Scene.extra_glass_width
-    del bpy.types.Scene.use_pixelation
-    del bpy.types.Scene.extra_object_threshold
-    del bpy.types.Scene.use_extra_object
-    del bpy.types.Scene.gap_size
-    del bpy.types.Scene.negative_size_x
-    del bpy.types.Scene.negative_size_y
-    del bpy.types.Scene.keep_extra_scale
-    del bpy.types.Scene.offset_z
-    del bpy.types.Scene.extra_shading_mode
-    del bpy.types.Scene.extra_pixelation
-    del bpy.types.Scene.use_extra_pixelation
-    del bpy.types.Scene.use_frustum_culling
-    del bpy.types.Scene.culling_camera
-    del bpy.types.Scene.use_instances_only
-    del bpy.types.Scene.sparse_grid_x
-    del bpy.types.Scene.sparse_grid_y
-    del bpy.types.Scene.use_extra_plane
-    del bpy.types.Scene.boolean_operation
-    del bpy.types.Scene.use_boolean
-    del bpy.types.Scene.base_material
-    del bpy.types.Scene.extra_material
-    del bpy.types.Scene.bevel_size
-    del bpy.types.Scene.extra_bevel_size
-    del bpy.types.Scene.realize_on_render
-    del bpy.types.Scene.active_frame_object
-    del bpy.types.Scene.frame_scale_offset
-    del bpy.types.Scene.frame_material
-    del bpy.types.Scene.floor_material
-    del bpy.types.Scene.extra_glass_material
-    del bpy.types.Scene.extra_plane_material
-    del bpy.types.Scene.render_detail_size
-    del bpy.types.Scene.use_random_rotation
-    del bpy.types.Scene.snap_rotation
-    del bpy.types.Scene.use_extra_random_rotation
-    del bpy.types.Scene.extra_snap_rotation
-    del bpy.types.Scene.extra_scale_offset
-    del bpy.types.Scene.use_extra_random_scale
-    del bpy.types.Scene.extra_random_scale_min
-    del bpy.types.Scene.extra_random_scale_max
-    del bpy.types.Scene.threshold_mode
-    del bpy.types.Scene.active_base_object
-    del bpy.types.Scene.active_extra_object
-    del bpy.types.Scene.active_boolean_object
-    del bpy.types.Scene.extra_glass_color
-    del bpy.types.Scene.base_proxy_object
-    del bpy.types.Scene.extra_proxy_object
-    del bpy.types.Scene.use_look_at_rotation
-    del bpy.types.Scene.look_at_object
-    del bpy.types.Scene.use_extra_look_at_rotation
-    del bpy.types.Scene.extra_look_at_object
-    del bpy.types.Scene.extra_location_offset_z
-    del bpy.types.Scene.keep_base_height
-    del bpy.types.Scene.background_mode
-    del bpy.types.Scene.background_color
-    del bpy.types.Scene.extra_plane_color
-    del bpy.types.Scene.floor_color
-    del bpy.types.Scene.frame_color
+    for setting in SETTINGS:
+        delattr(bpy.types.Scene, setting.name)
+
+
+# pointer setting type -> bpy.data collection manifest names are looked up in
+ID_COLLECTIONS = {
+    bpy.types.Object: "objects",
+    bpy.types.Material: "materials",
+    bpy.types.Camera: "cameras",
+}
+
+
+def setting_value(setting, value):
+    # manifest JSON value -> scene property value
+    if setting.prop_type is PointerProperty and value is not None:
+        collection = getattr(bpy.data, ID_COLLECTIONS[setting.prop_args["type"]])
+        return collection[value]
+    if setting.prop_type is FloatVectorProperty:
+        return tuple(value)
+    return value
+
+
+def check_range(setting, value):
+    # blender clamps out of range values silently, a sweep over them would
+    # render the same image under different labels
+    low, high = setting.prop_args.get("min"), setting.prop_args.get("max")
+    for component in (value if isinstance(value, (list, tuple)) else (value,)):
+        if not isinstance(component, (int, float)) or isinstance(component, bool):
+            continue
+        if (low is not None and component < low) or (high is not None and component > high):
+            raise ValueError("{} {} is outside {} to {}".format(setting.name, value, low, high))
+
+
+class ImageCache:
+    # images loaded for the batch modes, reused by (path, mtime, colorspace)
+    # so a texture used by several rows is decoded once; least recently used
+    # images nothing uses anymore are removed once the budget is exceeded
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.images = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, path, colorspace=None):
+        path = os.path.abspath(path)
+        key = (path, os.path.getmtime(path), colorspace)
+        image = self.images.get(key)
+        try:
+            if image is not None and image.name:
+                self.images.move_to_end(key)
+                self.hits += 1
+                return image
+        except ReferenceError:
+            pass
+        self.misses += 1
+        # a changed file is a new key, never hand out the stale pixels
+        image = bpy.data.images.load(path, check_existing=False)
+        if colorspace is not None:
+            image.colorspace_settings.name = colorspace
+        # evicted by the caller once the image is in use, see evict()
+        self.images[key] = image
+        return image
+
+    def size(self):
+        total = 0
+        for image in self.images.values():
+            with contextlib.suppress(ReferenceError):
+                width, height = image.size
+                total += width * height * image.channels * (4 if image.is_float else 1)
+        return total
+
+    def evict(self):
+        total = self.size()
+        for key, image in list(self.images.items()):
+            if total <= self.budget:
+                break
+            try:
+                if image.users:
+                    continue
+                width, height = image.size
+                total -= width * height * image.channels * (4 if image.is_float else 1)
+                bpy.data.images.remove(image)
+            except ReferenceError:
+                pass
+            del self.images[key]
+            self.evictions += 1
+
+    def stats(self):
+        return "image cache: {} hits, {} misses, {} evicted, {:.0f} MB".format(
+            self.hits, self.misses, self.evictions, self.size() / 2 ** 20)
+
+
+IMAGE_CACHE_BUDGET = 2 * 2 ** 30
+
+image_cache = ImageCache(IMAGE_CACHE_BUDGET)
+
+
+def image_colorspace(image):
+    return image.colorspace_settings.name if image is not None else None
+
+
+def set_color_texture(scene, handles, image):
+    # what picking the Color Texture in Quick Settings does, in either shading mode
+    handles.inputs["color_texture"].default_value = image
+    texture_node = scene.base_material.node_tree.nodes.get("Image Texture")
+    if texture_node is not None:
+        texture_node.image = image
+
+
+def apply_batch_row(scene, handles, row, base_dir, restore):
+    # restore holds the file's value of every setting an earlier row
+    # overrode, so overrides don't leak into the rows after it
+    overrides = row.get("settings", {})
+    for name in overrides:
+        if name not in SETTINGS_BY_NAME:
+            raise KeyError("unknown setting: " + name)
+        if name not in restore:
+            value = getattr(scene, name)
+            # vector properties read as a live view of the scene's value
+            restore[name] = tuple(value) if setting_size(SETTINGS_BY_NAME[name]) else value
+    with coalesced_update_tags():
+        for name, value in restore.items():
+            if name not in overrides:
+                setattr(scene, name, value)
+        for name, value in overrides.items():
+            setattr(scene, name, setting_value(SETTINGS_BY_NAME[name], value))
+
+        # new images keep the color space of the ones they replace
+        height_input = handles.inputs["height_texture"]
+        color_input = handles.inputs["color_texture"]
+        if "height" in row:
+            height_input.default_value = image_cache.load(
+                os.path.join(base_dir, row["height"]), image_colorspace(height_input.default_value))
+        if "color" in row:
+            set_color_texture(scene, handles, image_cache.load(
+                os.path.join(base_dir, row["color"]), image_colorspace(color_input.default_value)))
+        tag_update(handles.plane)
+        if scene.use_grid_textures:
+            refresh_grid_textures(scene)
+        refresh_baked_height(scene)
+    image_cache.evict()
+
+
+def read_manifest(manifest_path):
+    # {"output_dir": "renders",
+    #  "rows": [{"height": "h.png", "color": "c.png", "output": "out.png",
+    #            "settings": {"detail_height": 0.5}, "label": "burnt in"}],
+    #  "render": {"resolution_percentage": 25, "samples": 16}}
+    # paths are relative to the manifest, a row without "output" is written
+    # to output_dir as its row number
+    manifest_path = os.path.abspath(manifest_path)
+    base_dir = os.path.dirname(manifest_path)
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if isinstance(manifest, list):
+        manifest = {"rows": manifest}
+    output_dir = os.path.join(base_dir, manifest.get("output_dir", ""))
+    jobs = [{"index": index, "row": row, "base_dir": base_dir, "render": manifest.get("render", {}),
+             "output": os.path.join(output_dir, row.get("output", "{:04d}".format(index)))}
+            for index, row in enumerate(manifest["rows"])]
+    return jobs, output_dir
+
+
+# (path, mtime, size) -> sha256 of the file, hashing a file once per process
+_file_digests = {}
+
+
+def file_digest(path):
+    path = os.path.abspath(bpy.path.abspath(path))
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as data:
+            for chunk in iter(lambda: data.read(2 ** 20), b""):
+                digest.update(chunk)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+def image_digest(image):
+    if image is None:
+        return None
+    if image.packed_file is None and image.filepath:
+        return file_digest(image.filepath)
+    # packed or generated, identified by the .blend it lives in
+    return image.name
+
+
+def snapshot_value(value):
+    if isinstance(value, bpy.types.ID):
+        return value.name
+    if isinstance(value, (str, bool, int, float)) or value is None:
+        return value
+    return list(value)
+
+
+def render_snapshot(scene, handles):
+    # everything the rendered image depends on
+    texture_node = scene.base_material.node_tree.nodes.get("Image Texture")
+    render = scene.render
+    return {
+        "blend": file_digest(bpy.data.filepath) if bpy.data.filepath else None,
+        "settings": {setting.name: snapshot_value(getattr(scene, setting.name))
+                     for setting in SETTINGS},
+        "sockets": {socket: snapshot_value(handles.settings.get(socket))
+                    for socket in sorted({setting.socket for setting in SETTINGS if setting.socket})},
+        "images": [image_digest(handles.inputs["height_texture"].default_value),
+                   image_digest(handles.inputs["color_texture"].default_value),
+                   image_digest(texture_node.image if texture_node is not None else None)],
+        "render": [render.engine, render.resolution_x, render.resolution_y,
+                   render.resolution_percentage, render.image_settings.file_format,
+                   render.image_settings.color_depth, scene.frame_current,
+                   scene.cycles.samples if render.engine == 'CYCLES' else None,
+                   render.use_stamp and render.stamp_note_text],
+    }
+
+
+def snapshot_hash(scene, handles):
+    snapshot = json.dumps(render_snapshot(scene, handles), sort_keys=True)
+    return hashlib.sha256(snapshot.encode()).hexdigest()
+
+
+class RenderCache:
+    # renders stored under the hash of their render_snapshot(), a job whose
+    # snapshot was rendered before copies the stored image instead
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, scene, handles, output):
+        key = snapshot_hash(scene, handles)
+        return os.path.join(self.directory, key + os.path.splitext(output)[1])
+
+    def fetch(self, cached, output):
+        if not os.path.exists(cached):
+            self.misses += 1
+            return False
+        self.hits += 1
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        shutil.copyfile(cached, output)
+        return True
+
+    def store(self, cached, output):
+        os.makedirs(self.directory, exist_ok=True)
+        # copy and rename so concurrent workers never read half a file
+        shutil.copyfile(output, cached + ".tmp")
+        os.replace(cached + ".tmp", cached)
+
+    def stats(self):
+        return "render cache: {} hits, {} misses".format(self.hits, self.misses)
+
+
+render_cache = RenderCache()
+
+
+# stamp fields turned off for labeled rows, only the label and render time remain
+STAMP_FIELDS = ("date", "time", "frame", "frame_range", "memory", "hostname", "camera",
+                "lens", "scene", "marker", "filename", "sequencer_strip")
+
+
+# render properties a row's render settings or label may change, put back
+# after the row so they don't leak into the rows rendered after it
+RENDER_STATE = ("resolution_percentage", "use_stamp", "use_stamp_note", "stamp_note_text",
+                "use_stamp_render_time") + tuple("use_stamp_" + field for field in STAMP_FIELDS)
+
+
+@contextlib.contextmanager
+def render_settings(scene, job):
+    state = {name: getattr(scene.render, name) for name in RENDER_STATE
+             if hasattr(scene.render, name)}
+    samples = scene.cycles.samples
+    try:
+        render = job.get("render", {})
+        if "resolution_percentage" in render:
+            scene.render.resolution_percentage = render["resolution_percentage"]
+        if "samples" in render:
+            scene.cycles.samples = render["samples"]
+        label = job["row"].get("label")
+        if label is not None:
+            scene.render.use_stamp = True
+            for field in STAMP_FIELDS:
+                if hasattr(scene.render, "use_stamp_" + field):
+                    setattr(scene.render, "use_stamp_" + field, False)
+            scene.render.use_stamp_render_time = True
+            scene.render.use_stamp_note = True
+            scene.render.stamp_note_text = label
+        yield
+    finally:
+        for name, value in state.items():
+            setattr(scene.render, name, value)
+        scene.cycles.samples = samples
+
+
+def still_path(scene, path):
+    # the file write_still renders path to: no frame number, the format's
+    # extension added unless it's already there
+    path = bpy.path.abspath(path)
+    extension = scene.render.file_extension
+    if scene.render.use_file_extension and not path.lower().endswith(extension.lower()):
+        path += extension
+    return path
+
+
+def render_job(scene, handles, job, restore):
+    apply_batch_row(scene, handles, job["row"], job["base_dir"], restore)
+    with render_settings(scene, job):
+        flush_pending_inputs()
+        output = still_path(scene, job["output"])
+        scene.render.filepath = output
+        if render_cache.directory is None:
+            bpy.ops.render.render(write_still=True)
+            return
+        cached = render_cache.path(scene, handles, output)
+        job["cached"] = render_cache.fetch(cached, output)
+        if not job["cached"]:
+            bpy.ops.render.render(write_still=True)
+            render_cache.store(cached, output)
+
+
+def run_batch(manifest_path):
+    # blender -b project.blend -P project_panel.py -- batch manifest.json
+    # renders every row of the manifest without reloading the .blend
+    jobs, _ = read_manifest(manifest_path)
+    scene = bpy.context.scene
+    handles = scene_handles()
+    restore = {}
+    failed = 0
+    for job in jobs:
+        try:
+            render_job(scene, handles, job, restore)
+        except Exception as error:
+            failed += 1
+            print("3D Pixels batch: row {} failed: {}".format(job["index"], error))
+        else:
+            print("3D Pixels batch: row {} -> {}".format(job["index"], job["output"]))
+    print("3D Pixels batch: {} of {} rows rendered".format(len(jobs) - failed, len(jobs)))
+    print("3D Pixels batch: " + image_cache.stats())
+    if render_cache.directory is not None:
+        print("3D Pixels batch: " + render_cache.stats())
+    return failed
+
+
+# job queue of the worker pool, one JSON file per job moving through these
+# directories; claiming a job is an atomic rename out of "pending"
+QUEUE_DIRS = ("pending", "running", "done", "failed")
+QUEUE_POLL_INTERVAL = 0.2
+
+
+def write_job(path, job):
+    # write next to the target and rename, readers never see half a file
+    with open(path + ".tmp", "w") as job_file:
+        json.dump(job, job_file)
+    os.replace(path + ".tmp", path)
+
+
+def claim_job(queue_dir, worker):
+    pending = os.path.join(queue_dir, "pending")
+    for name in sorted(os.listdir(pending)):
+        if not name.endswith(".json"):
+            continue
+        running = os.path.join(queue_dir, "running", "{}.{}".format(worker, name))
+        try:
+            os.rename(os.path.join(pending, name), running)
+        except OSError:
+            # another worker got it first
+            continue
+        with open(running) as job_file:
+            return running, json.load(job_file)
+    return None, None
+
+
+def run_worker(queue_dir, worker, threads):
+    # blender -b project.blend -P project_panel.py -- worker QUEUE_DIR --id N
+    # renders jobs from the queue until the coordinator creates QUEUE_DIR/stop
+    scene = bpy.context.scene
+    if threads:
+        scene.render.threads_mode = 'FIXED'
+        scene.render.threads = threads
+    handles = scene_handles()
+    restore = {}
+    while True:
+        running, job = claim_job(queue_dir, worker)
+        if job is None:
+            if os.path.exists(os.path.join(queue_dir, "stop")):
+                print("3D Pixels worker {}: {}".format(worker, image_cache.stats()))
+                if render_cache.directory is not None:
+                    print("3D Pixels worker {}: {}".format(worker, render_cache.stats()))
+                return
+            time.sleep(QUEUE_POLL_INTERVAL)
+            continue
+        started = time.monotonic()
+        try:
+            render_job(scene, handles, job, restore)
+        except Exception as error:
+            job["error"] = str(error)
+            state = "failed"
+        else:
+            state = "done"
+        job["seconds"] = time.monotonic() - started
+        job["worker"] = worker
+        write_job(os.path.join(queue_dir, state, os.path.basename(running)), job)
+        os.remove(running)
+
+
+def run_pool(manifest_path, workers, threads, retries, script_path):
+    # blender -b project.blend -P project_panel.py -- pool manifest.json
+    # renders the manifest with several background Blender processes, each
+    # with its own share of the render threads, and writes
+    # output_dir/results.json with the status and timing of every row
+    jobs, output_dir = read_manifest(manifest_path)
+    queue_dir = os.path.join(output_dir, ".queue")
+    # whatever an interrupted run left behind
+    shutil.rmtree(queue_dir, ignore_errors=True)
+    for name in QUEUE_DIRS:
+        os.makedirs(os.path.join(queue_dir, name))
+    for job in jobs:
+        job["attempt"] = 1
+        write_job(os.path.join(queue_dir, "pending", "{:06d}.json".format(job["index"])), job)
+
+    def spawn(worker):
+        return subprocess.Popen([
+            bpy.app.binary_path, "-b", bpy.data.filepath, "-P", script_path,
+            "--", "worker", queue_dir, "--id", str(worker), "--threads", str(threads),
+            "--image-cache-mb", str(image_cache.budget // 2 ** 20)]
+            + (["--render-cache", render_cache.directory] if render_cache.directory else []))
+
+    processes = {worker: spawn(worker) for worker in range(workers)}
+    respawns = workers * (retries + 1)
+    results = {}
+    try:
+        while len(results) < len(jobs):
+            time.sleep(QUEUE_POLL_INTERVAL)
+            for state in ("done", "failed"):
+                state_dir = os.path.join(queue_dir, state)
+                for name in os.listdir(state_dir):
+                    if not name.endswith(".json"):
+                        continue
+                    path = os.path.join(state_dir, name)
+                    with open(path) as job_file:
+                        job = json.load(job_file)
+                    os.remove(path)
+                    if state == "failed" and job["attempt"] <= retries:
+                        print("3D Pixels pool: row {} failed, retrying: {}".format(job["index"], job["error"]))
+                        job["attempt"] += 1
+                        del job["error"]
+                        write_job(os.path.join(queue_dir, "pending", name.split(".", 1)[1]), job)
+                    else:
+                        results[job["index"]] = dict(job, state=state)
+                        print("3D Pixels pool: row {} {} in {:.1f}s".format(job["index"], state, job["seconds"]))
+
+            for worker, process in processes.items():
+                if process.poll() is None:
+                    continue
+                # a crashed worker takes its job down with it, queue it again
+                prefix = "{}.".format(worker)
+                for name in os.listdir(os.path.join(queue_dir, "running")):
+                    if name.startswith(prefix):
+                        path = os.path.join(queue_dir, "running", name)
+                        with open(path) as job_file:
+                            job = json.load(job_file)
+                        os.remove(path)
+                        job["attempt"] += 1
+                        if job["attempt"] > retries + 1:
+                            results[job["index"]] = dict(job, state="failed", error="worker crashed")
+                        else:
+                            write_job(os.path.join(queue_dir, "pending", name[len(prefix):]), job)
+                if not respawns:
+                    raise RuntimeError("3D Pixels pool: workers keep exiting, see their output above")
+                respawns -= 1
+                processes[worker] = spawn(worker)
+    finally:
+        # workers poll the queue until told to stop, stop them when giving up too
+        open(os.path.join(queue_dir, "stop"), "w").close()
+        for process in processes.values():
+            if len(results) < len(jobs):
+                process.terminate()
+            process.wait()
+
+    results = [results[index] for index in sorted(results)]
+    with open(os.path.join(output_dir, "results.json"), "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    failed = sum(1 for result in results if result["state"] == "failed")
+    print("3D Pixels pool: {} of {} rows rendered".format(len(results) - failed, len(results)))
+    return failed
+
+
+def write_json(path, data):
+    with open(path + ".tmp", "w") as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def run_animation(start=None, end=None, output=None):
+    # blender -b project.blend -P project_panel.py -- animation
+    # renders the frame range frame by frame and records every finished frame
+    # in checkpoint.json next to the outputs; a restarted render skips the
+    # frames whose output still exists and whose settings hash didn't change
+    scene = bpy.context.scene
+    handles = scene_handles()
+    if output is not None:
+        scene.render.filepath = output
+    start = scene.frame_start if start is None else start
+    end = scene.frame_end if end is None else end
+    checkpoint_path = os.path.join(
+        os.path.dirname(bpy.path.abspath(scene.render.frame_path(frame=start))), "checkpoint.json")
+    checkpoint = {}
+    with contextlib.suppress(FileNotFoundError, ValueError):
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+
+    # write_still ignores the frame number, each frame is rendered to its own
+    # frame path and the pattern put back afterwards
+    pattern = scene.render.filepath
+    rendered = skipped = 0
+    for frame in range(start, end + 1, scene.frame_step):
+        scene.render.filepath = pattern
+        frame_output = bpy.path.abspath(scene.render.frame_path(frame=frame))
+        done = checkpoint.get(str(frame))
+        # the cheap file checks first, a frame without a finished output is
+        # rendered whatever its hash, so it's not evaluated for one
+        finished = (done is not None and done["output"] == frame_output
+                    and os.path.exists(frame_output) and os.path.getsize(frame_output) == done["size"])
+        scene.frame_set(frame)
+        flush_pending_inputs()
+        key = snapshot_hash(scene, handles)
+        if finished and done["hash"] == key:
+            skipped += 1
+            continue
+
+        started = time.monotonic()
+        scene.render.filepath = frame_output
+        bpy.ops.render.render(write_still=True)
+        checkpoint[str(frame)] = {"hash": key, "output": frame_output,
+                                  "size": os.path.getsize(frame_output),
+                                  "seconds": time.monotonic() - started}
+        write_json(checkpoint_path, checkpoint)
+        rendered += 1
+        print("3D Pixels animation: frame {} -> {}".format(frame, frame_output))
+    scene.render.filepath = pattern
+    print("3D Pixels animation: {} frames rendered, {} up to date".format(rendered, skipped))
+
+
+def tile_bounds(size, count, index):
+    return size * index // count, size * (index + 1) // count
+
+
+def sensor_fit_size(camera, width, height):
+    if camera.sensor_fit == 'HORIZONTAL':
+        return width
+    if camera.sensor_fit == 'VERTICAL':
+        return height
+    return max(width, height)
+
+
+def poster_size(scene):
+    render = scene.render
+    return (render.resolution_x * render.resolution_percentage // 100,
+            render.resolution_y * render.resolution_percentage // 100)
+
+
+def tile_camera(scene, tiles, index):
+    # copy of the scene camera framing only one tile of the full image: the
+    # same view per pixel (lens/ortho scale), shifted onto the tile's center
+    columns, rows = tiles
+    width, height = poster_size(scene)
+    x0, x1 = tile_bounds(width, columns, index % columns)
+    y0, y1 = tile_bounds(height, rows, index // columns)
+    camera = scene.camera.copy()
+    camera.data = scene.camera.data.copy()
+    # culling_camera_set finds the object by the camera data's name
+    camera.name = camera.data.name = "Poster Tile Camera"
+    scene.collection.objects.link(camera)
+
+    data = camera.data
+    full_fit = sensor_fit_size(data, width, height)
+    tile_fit = sensor_fit_size(data, x1 - x0, y1 - y0)
+    if data.type == 'ORTHO':
+        data.ortho_scale *= tile_fit / full_fit
+    else:
+        data.lens *= full_fit / tile_fit
+    data.shift_x = (data.shift_x * full_fit + (x0 + x1) / 2 - width / 2) / tile_fit
+    data.shift_y = (data.shift_y * full_fit + (y0 + y1) / 2 - height / 2) / tile_fit
+    return camera, (x1 - x0, y1 - y0)
 
 
-if __name__ == "__main__":
+def render_tile(tiles, index, output, cull):
+    # blender -b project.blend -P project_panel.py -- tile --tiles 4x4 --index I --output PATH
+    scene = bpy.context.scene
+    if scene.camera is None:
+        raise RuntimeError("3D Pixels tile: the scene has no camera")
+    camera, (width, height) = tile_camera(scene, tiles, index)
+    scene.camera = camera
+    scene.render.resolution_x = width
+    scene.render.resolution_y = height
+    scene.render.resolution_percentage = 100
+    scene.render.use_border = False
+    if cull and scene.shading_mode == 'VERTEX':
+        raise RuntimeError("3D Pixels tile: --cull doesn't work with vertex color shading")
+    if cull:
+        # only the pins inside the tile get instanced (and realized)
+        scene.use_frustum_culling = True
+        scene.culling_camera = camera.data
+    flush_pending_inputs()
+    scene.render.filepath = output
+    bpy.ops.render.render(write_still=True)
+
+
+# PNG color type and channel count per color mode
+PNG_COLOR_TYPES = {'BW': (0, 1), 'RGB': (2, 3), 'RGBA': (6, 4)}
+FLOAT_FORMATS = ('OPEN_EXR', 'OPEN_EXR_MULTILAYER', 'HDR')
+
+
+def png_chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+
+def write_png(path, width, height, bands, color_mode, depth):
+    # bands of rows, top row first, with values 0-1; each band is compressed
+    # and written as it comes so the full image is never held in memory
+    color_type, channels = PNG_COLOR_TYPES[color_mode]
+    dtype, scale = (numpy.dtype(">u2"), 65535) if depth == 16 else (numpy.dtype("u1"), 255)
+    compressor = zlib.compressobj()
+    with open(path, "wb") as png:
+        png.write(b"\x89PNG\r\n\x1a\n")
+        png.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, depth, color_type, 0, 0, 0)))
+        for band in bands:
+            values = numpy.rint(numpy.clip(band[..., :channels], 0.0, 1.0) * scale).astype(dtype)
+            rows = values.reshape(len(values), -1).view(numpy.uint8)
+            # every scanline starts with its filter type, 0 (none)
+            lines = numpy.zeros((len(rows), rows.shape[1] + 1), dtype=numpy.uint8)
+            lines[:, 1:] = rows
+            data = compressor.compress(lines.tobytes())
+            if data:
+                png.write(png_chunk(b"IDAT", data))
+        png.write(png_chunk(b"IDAT", compressor.flush()))
+        png.write(png_chunk(b"IEND", b""))
+
+
+def tile_bands(tiles, tile_paths, width):
+    # the poster one row of tiles at a time, top band first and each band top
+    # row first; tiles are read as stored, without color management
+    columns, rows = tiles
+    for row in reversed(range(rows)):
+        band = None
+        for column in range(columns):
+            tile = bpy.data.images.load(tile_paths[row * columns + column], check_existing=False)
+            tile.colorspace_settings.name = 'Non-Color'
+            tile_width, tile_height = tile.size
+            pixels = numpy.empty(len(tile.pixels), dtype=numpy.float32)
+            tile.pixels.foreach_get(pixels)
+            pixels = pixels.reshape(tile_height, tile_width, tile.channels)[..., :4]
+            bpy.data.images.remove(tile)
+            if band is None:
+                band = numpy.ones((tile_height, width, 4), dtype=numpy.float32)
+            x0, x1 = tile_bounds(width, columns, column)
+            band[:, x0:x1, :pixels.shape[2]] = pixels
+        yield band[::-1]
+
+
+def stitch_tiles(scene, tiles, tile_paths, output):
+    width, height = poster_size(scene)
+    settings = scene.render.image_settings
+    if settings.file_format in FLOAT_FORMATS:
+        # the float formats keep their range, stitched in a float image
+        pixels = numpy.concatenate(list(tile_bands(tiles, tile_paths, width)))[::-1]
+        poster = bpy.data.images.new("Poster", width, height, alpha=True, float_buffer=True)
+        poster.colorspace_settings.name = 'Non-Color'
+        poster.pixels.foreach_set(pixels.ravel())
+        del pixels
+        poster.filepath_raw = output
+        poster.file_format = settings.file_format
+        poster.save()
+        bpy.data.images.remove(poster)
+        return
+
+    bands = tile_bands(tiles, tile_paths, width)
+    if settings.file_format == 'PNG':
+        write_png(output, width, height, bands, settings.color_mode, int(settings.color_depth or 8))
+        return
+    # other formats are converted from an 8-bit PNG, which Blender loads into
+    # an 8-bit buffer
+    stitched = output + ".png"
+    write_png(stitched, width, height, bands, 'RGBA', 8)
+    poster = bpy.data.images.load(stitched, check_existing=False)
+    poster.colorspace_settings.name = 'Non-Color'
+    poster.filepath_raw = output
+    poster.file_format = settings.file_format
+    poster.save()
+    bpy.data.images.remove(poster)
+    os.remove(stitched)
+
+
+def run_poster(tiles, output, workers, cull, script_path):
+    # blender -b project.blend -P project_panel.py -- poster --tiles 4x4 --output poster.png
+    # renders the camera frame as separate tile processes, each holding only
+    # its part of the pin grid, and stitches the tiles into one image
+    scene = bpy.context.scene
+    if scene.camera is None:
+        # the tiles are cut from the camera's frame
+        raise RuntimeError("3D Pixels poster: the scene has no camera to render the poster from")
+    if cull and scene.shading_mode == 'VERTEX':
+        # frustum culling drops the vertex colors of the pins
+        raise RuntimeError("3D Pixels poster: --cull doesn't work with vertex color shading, "
+                           "switch Base Shading to Textured or render without --cull")
+    output = os.path.abspath(bpy.path.abspath(output))
+    # tiles are only reused by a run with the same grid and scene
+    tile_root = output + ".tiles"
+    tile_dir = os.path.join(tile_root, "{}x{}{}-{}".format(
+        tiles[0], tiles[1], "-cull" if cull else "", snapshot_hash(scene, scene_handles())[:16]))
+    os.makedirs(tile_dir, exist_ok=True)
+    extension = scene.render.file_extension
+    count = tiles[0] * tiles[1]
+    tile_paths = [os.path.join(tile_dir, "{:04d}{}".format(index, extension))
+                  for index in range(count)]
+
+    def spawn(index):
+        return subprocess.Popen(
+            [bpy.app.binary_path, "-b", bpy.data.filepath, "-P", script_path, "--", "tile",
+             "--tiles", "{}x{}".format(*tiles), "--index", str(index),
+             "--output", tile_paths[index]] + (["--cull"] if cull else []))
+
+    # tiles a previous run already rendered are kept
+    waiting = [index for index in range(count) if not os.path.exists(tile_paths[index])]
+    attempts = collections.Counter()
+    running = {}
+    while waiting or running:
+        while waiting and len(running) < workers:
+            index = waiting.pop(0)
+            attempts[index] += 1
+            running[index] = spawn(index)
+        time.sleep(QUEUE_POLL_INTERVAL)
+        for index, process in list(running.items()):
+            if process.poll() is None:
+                continue
+            del running[index]
+            if process.returncode == 0 and os.path.exists(tile_paths[index]):
+                print("3D Pixels poster: tile {} of {} rendered".format(index + 1, count))
+            elif attempts[index] < 2:
+                waiting.append(index)
+            else:
+                raise RuntimeError("3D Pixels poster: tile {} failed twice".format(index))
+
+    stitch_tiles(scene, tiles, tile_paths, output)
+    shutil.rmtree(tile_root)
+    print("3D Pixels poster: " + output)
+
+
+def contact_sheet(paths, columns, output, file_format):
+    # cells in reading order, left to right and top to bottom, missing
+    # cells (None) stay black
+    cells = []
+    for path in paths:
+        if path is None:
+            cells.append(None)
+            continue
+        image = bpy.data.images.load(path)
+        width, height = image.size
+        pixels = numpy.empty(len(image.pixels), dtype=numpy.float32)
+        image.pixels.foreach_get(pixels)
+        cells.append(pixels.reshape(height, width, image.channels)[..., :4])
+        bpy.data.images.remove(image)
+    height, width = next(cell for cell in cells if cell is not None).shape[:2]
+    rows = -(-len(cells) // columns)
+    sheet = numpy.zeros((rows * height, columns * width, 4), dtype=numpy.float32)
+    for index, cell in enumerate(cells):
+        if cell is None:
+            continue
+        # image rows are stored bottom first
+        y = (rows - 1 - index // columns) * height
+        x = index % columns * width
+        sheet[y:y + height, x:x + width] = cell
+
+    float_buffer = file_format in ('OPEN_EXR', 'OPEN_EXR_MULTILAYER', 'HDR')
+    image = bpy.data.images.new("Contact Sheet", columns * width, rows * height,
+                                alpha=True, float_buffer=float_buffer)
+    image.pixels.foreach_set(sheet.ravel())
+    image.filepath_raw = output
+    image.file_format = file_format
+    image.save()
+    bpy.data.images.remove(image)
+
+
+def run_sweep(grid_path, output, workers, threads, percentage, samples, script_path):
+    # blender -b project.blend -P project_panel.py -- sweep grid.json --output sheet.png
+    # renders every combination of the setting values in grid.json, e.g.
+    # {"detail_size": [4, 8], "gap_size": [0.0, 0.1]}, on the worker pool
+    # at a reduced resolution/sample count and lays the labeled renders out
+    # on a contact sheet, one column per value of the last setting
+    scene = bpy.context.scene
+    with open(grid_path) as grid_file:
+        grid = json.load(grid_file)
+    for name, values in grid.items():
+        if name not in SETTINGS_BY_NAME:
+            raise KeyError("unknown setting: " + name)
+        for value in values:
+            check_range(SETTINGS_BY_NAME[name], value)
+    output = os.path.abspath(bpy.path.abspath(output))
+    cell_dir = output + ".cells"
+    os.makedirs(cell_dir, exist_ok=True)
+
+    rows = []
+    for values in itertools.product(*grid.values()):
+        settings = dict(zip(grid, values))
+        label = "  ".join("{} {}".format(name, value) for name, value in settings.items())
+        rows.append({"settings": settings, "label": label})
+    manifest_path = os.path.join(cell_dir, "manifest.json")
+    write_json(manifest_path, {"rows": rows, "render": {"resolution_percentage": percentage,
+                                                         "samples": samples}})
+    failed = run_pool(manifest_path, workers, threads, 1, script_path)
+
+    extension = scene.render.file_extension
+    paths = [os.path.join(cell_dir, "{:04d}{}".format(index, extension)) for index in range(len(rows))]
+    columns = len(list(grid.values())[-1]) if grid else 1
+    contact_sheet([path if os.path.exists(path) else None for path in paths], columns, output,
+                  scene.render.image_settings.file_format)
+    print("3D Pixels sweep: {} (render times in {})".format(
+        output, os.path.join(cell_dir, "results.json")))
+    return failed
+
+
+def tile_grid(value):
+    columns, _, rows = value.lower().partition("x")
+    return int(columns), int(rows or columns)
+
+
+def parse_args(argv):
+    args = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(
+        prog="blender -b project.blend -P project_panel.py --")
+    commands = parser.add_subparsers(dest="command")
+    batch = commands.add_parser("batch", help="render a manifest in this process")
+    batch.add_argument("manifest")
+    batch.add_argument("--render-cache", metavar="DIR",
+                       help="reuse renders of identical jobs stored in DIR")
+    batch.add_argument("--image-cache-mb", type=int, default=IMAGE_CACHE_BUDGET // 2 ** 20)
+    pool = commands.add_parser("pool", help="render a manifest with several worker processes")
+    pool.add_argument("manifest")
+    pool.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 8))
+    pool.add_argument("--threads", type=int, default=0,
+                      help="render threads per worker (0: cpu count / workers)")
+    pool.add_argument("--retries", type=int, default=2)
+    pool.add_argument("--render-cache", metavar="DIR",
+                      help="reuse renders of identical jobs stored in DIR")
+    pool.add_argument("--image-cache-mb", type=int, default=IMAGE_CACHE_BUDGET // 2 ** 20,
+                      help="image cache budget per worker")
+    animation = commands.add_parser("animation", help="render a frame range, resuming an interrupted render")
+    animation.add_argument("--start", type=int)
+    animation.add_argument("--end", type=int)
+    animation.add_argument("--output", help="output path, defaults to the scene's")
+    sweep = commands.add_parser("sweep", help="render setting combinations onto a contact sheet")
+    sweep.add_argument("grid", help='JSON of setting name -> values, e.g. {"gap_size": [0.0, 0.1]}')
+    sweep.add_argument("--output", required=True)
+    sweep.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 8))
+    sweep.add_argument("--threads", type=int, default=0)
+    sweep.add_argument("--resolution-percentage", type=int, default=25)
+    sweep.add_argument("--samples", type=int, default=16)
+    sweep.add_argument("--render-cache", metavar="DIR",
+                       help="reuse renders of identical jobs stored in DIR")
+    sweep.add_argument("--image-cache-mb", type=int, default=IMAGE_CACHE_BUDGET // 2 ** 20)
+    poster = commands.add_parser("poster", help="render a large image as tiles in separate processes")
+    poster.add_argument("--tiles", type=tile_grid, default=(4, 4), help="columns x rows, e.g. 4x4")
+    poster.add_argument("--output", required=True)
+    poster.add_argument("--workers", type=int, default=1, help="tiles rendered at once")
+    poster.add_argument("--cull", action="store_true",
+                        help="frustum cull the pins outside each tile")
+    tile = commands.add_parser("tile", help="render one tile of a poster")
+    tile.add_argument("--tiles", type=tile_grid, required=True)
+    tile.add_argument("--index", type=int, required=True)
+    tile.add_argument("--output", required=True)
+    tile.add_argument("--cull", action="store_true")
+    worker = commands.add_parser("worker", help="render jobs from a pool's queue")
+    worker.add_argument("queue")
+    worker.add_argument("--id", type=int, default=0)
+    worker.add_argument("--threads", type=int, default=0)
+    worker.add_argument("--render-cache", metavar="DIR",
+                        help="reuse renders of identical jobs stored in DIR")
+    worker.add_argument("--image-cache-mb", type=int, default=IMAGE_CACHE_BUDGET // 2 ** 20)
+    return parser.parse_args(args)
+
+
+def main(argv):
+    args = parse_args(argv)
     register()
+    if args.command in ("batch", "pool", "worker", "sweep"):
+        image_cache.budget = args.image_cache_mb * 2 ** 20
+        if args.render_cache:
+            render_cache.directory = os.path.abspath(args.render_cache)
+    failed = 0
+    if args.command == "batch":
+        failed = run_batch(args.manifest)
+    elif args.command == "pool":
+        threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+        failed = run_pool(args.manifest, args.workers, threads, args.retries,
+                          os.path.abspath(__file__))
+    elif args.command == "worker":
+        run_worker(args.queue, args.id, args.threads)
+    elif args.command == "animation":
+        run_animation(args.start, args.end, args.output)
+    elif args.command == "sweep":
+        threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+        failed = run_sweep(args.grid, args.output, args.workers, threads,
+                           args.resolution_percentage, args.samples, os.path.abspath(__file__))
+    elif args.command == "poster":
+        run_poster(args.tiles, args.output, args.workers, args.cull, os.path.abspath(__file__))
+    elif args.command == "tile":
+        render_tile(args.tiles, args.index, args.output, args.cull)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
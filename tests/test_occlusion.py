@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+pytest.importorskip("bpy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import project_panel  # noqa: E402
+
+
+# a 10 x 4 lattice with a pitch of 1 m, pins 0.8 m wide and 0.2 m apart
+DETAIL_SIZE = 0.8
+GAP_SIZE = 0.2
+# pin heights in meters: texture values times detail_height
+DETAIL_HEIGHT = 2.0
+LOW_HEIGHT = 0.05
+WALL_HEIGHT = 1.0
+COLUMNS, ROWS = 10, 4
+WALL_COLUMN, TESTED_COLUMN = 2, 6
+
+
+def lattice(wall_rows):
+    x, y = numpy.meshgrid(numpy.arange(COLUMNS, dtype=numpy.float32),
+                          numpy.arange(ROWS, dtype=numpy.float32))
+    points = numpy.stack([x.ravel(), y.ravel()], axis=1)
+    values = numpy.full((ROWS, COLUMNS), LOW_HEIGHT, dtype=numpy.float32)
+    values[wall_rows, WALL_COLUMN] = WALL_HEIGHT
+    return points, values.ravel() * DETAIL_HEIGHT
+
+
+def occluded(wall_rows, camera_position, solid):
+    points, heights = lattice(wall_rows)
+    tested = numpy.array([1 * COLUMNS + TESTED_COLUMN])
+    return project_panel.occlusion_mask(points, heights, numpy.array(camera_position), 0.0,
+                                        tested, solid)[0]
+
+
+def test_pin_behind_a_wall_is_occluded():
+    # the camera looks down the pin's own row, the wall pins in front of it
+    # are taller than the camera
+    solid = DETAIL_SIZE / (DETAIL_SIZE + GAP_SIZE)
+    assert occluded([0, 1, 2, 3], (-20.0, 1.0, 1.0), solid)
+
+
+def test_pin_seen_through_the_gap_is_kept():
+    # the rays of the pin's near corners pass between the wall pins of rows 1
+    # and 2, through the gap
+    solid = DETAIL_SIZE / (DETAIL_SIZE + GAP_SIZE)
+    assert not occluded([1, 2], (-20.0, 1.5, 1.0), solid)
+    # the same rays are blocked when the pins fill their cells
+    assert occluded([1, 2], (-20.0, 1.5, 1.0), 1.0)
+
+
+def test_pin_above_the_wall_is_kept():
+    # the camera is high enough to look over the wall
+    solid = DETAIL_SIZE / (DETAIL_SIZE + GAP_SIZE)
+    assert not occluded([0, 1, 2, 3], (-20.0, 1.0, 40.0), solid)